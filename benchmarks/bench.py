@@ -0,0 +1,188 @@
+"""Poll a growing fleet of simulated projectors and report throughput, latency, loop stalls and memory.
+
+    python -m benchmarks.bench --sizes 1,10,30 --cycles 20 --latency 0.01
+"""
+import argparse
+import asyncio
+import functools
+import json
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence
+
+from socket_projector.hub import Projector, ProjectorConfiguration, ProjectorStateCommandConfiguration
+from socket_projector.protocol import PROTOCOLS_DIR, ProtocolProfile
+from socket_projector.runtime import DEFAULT_GATEWAY_LIMIT, GatewayLimiter
+
+from .simulator import SimulatorConfig, start_fleet
+
+# how often the stall probe wants to run, a late wake-up is time the loop was blocked
+PROBE_INTERVAL = 0.005
+
+
+@dataclass
+class FleetResult:
+    projectors: int
+    cycles: int
+    commands: int
+    seconds: float
+    commands_per_second: float
+    poll_p50_ms: float
+    poll_p99_ms: float
+    loop_stall_total_ms: float
+    loop_stall_max_ms: float
+    memory_per_projector_kib: float
+
+
+class LoopStallProbe:
+    """Sleeps in short steps and adds up how much later than asked each wake-up came."""
+
+    def __init__(self, interval: float = PROBE_INTERVAL) -> None:
+        self._interval = interval
+        self._task: Optional[asyncio.Future] = None
+        self.total = 0.0
+        self.max = 0.0
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            late = max(0.0, loop.time() - expected)
+            self.total += late
+            self.max = max(self.max, late)
+
+    def __enter__(self) -> 'LoopStallProbe':
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._task.cancel()
+
+
+def _percentile(samples: Sequence[float], q: float) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method='inclusive')[q - 1]
+
+
+@functools.lru_cache(maxsize=None)
+def _bench_profile() -> ProtocolProfile:
+    """The BenQ profile the simulator speaks, without warm-up or cool-down.
+
+    The simulator is on right after pow=on; with the real warm-up every projector would sit in
+    its transition for the whole run and the polls would skip the attributes that need a lamp.
+    """
+    with (PROTOCOLS_DIR / 'benq.json').open(encoding='utf-8') as file:
+        spec = json.load(file)
+    spec['power'] = {**spec['power'], 'warm_up': 0, 'cool_down': 0}
+    return ProtocolProfile('benq', spec)
+
+
+def _projector(index: int, url: str, timeout: float, limiter: Optional[GatewayLimiter],
+               listen: bool = False) -> Projector:
+    statecommandconfig = ProjectorStateCommandConfiguration.from_profile(_bench_profile())
+    return Projector(projector_id='bench{}'.format(index),
+                     projector_configuration=ProjectorConfiguration(socket_url=url, timeout=timeout, baudrate=9600,
+                                                                    statecommandconfig=statecommandconfig,
+                                                                    listen=listen),
+                     limiter=limiter)
+
+
+async def _timed_poll(projector: Projector, samples: List[float]) -> None:
+    started = time.perf_counter()
+    await projector.poll()
+    samples.append(time.perf_counter() - started)
+
+
+async def bench_fleet(size: int,
+                      cycles: int,
+                      config: SimulatorConfig,
+                      gateways: int = 0,
+                      gateway_limit: int = DEFAULT_GATEWAY_LIMIT,
+                      timeout: float = 1) -> FleetResult:
+    """Poll `size` projectors `cycles` times, all projectors of a cycle at once.
+
+    With `gateways` the projectors are spread evenly over that many simulated gateways,
+    each allowing `gateway_limit` open connections.
+    """
+    simulators = await start_fleet(size, config)
+    limiters = [GatewayLimiter('gateway{}'.format(index), gateway_limit) for index in range(gateways)]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    projectors = [_projector(index, simulator.url, timeout, limiters[index % gateways] if limiters else None)
+                  for index, simulator in enumerate(simulators)]
+    for projector in projectors:
+        await projector.turn_on()
+    samples: List[float] = []
+    try:
+        await asyncio.gather(*(_timed_poll(projector, samples) for projector in projectors))
+        memory = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        tracemalloc.stop()
+        served = sum(simulator.stats.commands for simulator in simulators)
+        samples.clear()
+        started = time.perf_counter()
+        with LoopStallProbe() as probe:
+            for _ in range(cycles):
+                await asyncio.gather(*(_timed_poll(projector, samples) for projector in projectors))
+        seconds = time.perf_counter() - started
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        await asyncio.gather(*(projector.close() for projector in projectors))
+        await asyncio.gather(*(simulator.stop() for simulator in simulators))
+    commands = sum(simulator.stats.commands for simulator in simulators) - served
+    return FleetResult(
+        projectors=size,
+        cycles=cycles,
+        commands=commands,
+        seconds=round(seconds, 3),
+        commands_per_second=round(commands / seconds, 1) if seconds else 0.0,
+        poll_p50_ms=round(_percentile(samples, 50) * 1000, 2),
+        poll_p99_ms=round(_percentile(samples, 99) * 1000, 2),
+        loop_stall_total_ms=round(probe.total * 1000, 2),
+        loop_stall_max_ms=round(probe.max * 1000, 2),
+        memory_per_projector_kib=round(memory / size / 1024, 1),
+    )
+
+
+async def run(sizes: Sequence[int],
+              cycles: int,
+              config: SimulatorConfig,
+              gateways: int = 0,
+              gateway_limit: int = DEFAULT_GATEWAY_LIMIT) -> List[FleetResult]:
+    return [await bench_fleet(size, cycles, config, gateways, gateway_limit) for size in sizes]
+
+
+def _print_table(results: Sequence[FleetResult]) -> None:
+    columns = list(asdict(results[0]))
+    rows = [[str(value) for value in asdict(result).values()] for result in results]
+    widths = [max(len(column), *(len(row[index]) for row in rows)) for index, column in enumerate(columns)]
+    for row in [columns] + rows:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,5,10,30', help='comma separated fleet sizes')
+    parser.add_argument('--cycles', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated answer delay in seconds')
+    parser.add_argument('--no-echo', action='store_true')
+    parser.add_argument('--gateways', type=int, default=0, help='spread the fleet over this many gateways')
+    parser.add_argument('--gateway-limit', type=int, default=DEFAULT_GATEWAY_LIMIT,
+                        help='open connections allowed per gateway')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+    config = SimulatorConfig(echo=not args.no_echo, latency=args.latency)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = asyncio.run(run(sizes, args.cycles, config, args.gateways, args.gateway_limit))
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        _print_table(results)
+
+
+if __name__ == '__main__':
+    main()
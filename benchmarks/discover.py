@@ -0,0 +1,74 @@
+"""Scan a loopback /24 with simulated projectors on some of its addresses and report what was found.
+
+    python -m benchmarks.discover --projectors 5 --ports 23,4001,4352,8899,10001
+
+Linux routes all of 127.0.0.0/8 to the loopback device, so every simulator gets its own address.
+"""
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Sequence
+
+from socket_projector.discovery import DEFAULT_PORTS, async_discover, hosts_of
+from socket_projector.protocol import load_profile
+
+from .simulator import ProjectorSimulator, SimulatorConfig
+
+
+@dataclass
+class DiscoveryResult:
+    targets: int
+    simulated: int
+    found: int
+    missing: List[str]
+    seconds: float
+
+
+async def bench_discovery(projectors: int,
+                          ports: Sequence[int],
+                          subnet: str = '127.0.0.0/24',
+                          concurrency: int = 128) -> DiscoveryResult:
+    hosts = hosts_of(subnet)
+    port = ports[-1]
+    simulators = []
+    for index, host in enumerate(hosts[:projectors]):
+        # every other one without echo, so both kinds are identified
+        simulator = ProjectorSimulator(SimulatorConfig(model='SIM{}'.format(index), echo=index % 2 == 0))
+        await simulator.start(host, port)
+        simulators.append(simulator)
+    expected = {'socket://{}:{}'.format(host, port) for host in hosts[:projectors]}
+    profiles = [load_profile(name) for name in ('benq', 'epson', 'pjlink')]
+    try:
+        started = time.perf_counter()
+        found = await async_discover(hosts, ports, profiles, [9600], timeout=1.0, concurrency=concurrency)
+        seconds = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(simulator.stop() for simulator in simulators))
+    urls = {projector.url for projector in found}
+    return DiscoveryResult(targets=len(hosts) * len(ports), simulated=len(simulators), found=len(found),
+                           missing=sorted(expected - urls), seconds=round(seconds, 3))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projectors', type=int, default=5)
+    parser.add_argument('--ports', default=','.join(map(str, DEFAULT_PORTS)))
+    parser.add_argument('--subnet', default='127.0.0.0/24')
+    parser.add_argument('--concurrency', type=int, default=128)
+    parser.add_argument('--json', action='store_true', help="print the result as json")
+    args = parser.parse_args()
+    result = asyncio.run(bench_discovery(args.projectors, [int(port) for port in args.ports.split(',')],
+                                         args.subnet, args.concurrency))
+    if args.json:
+        print(json.dumps(asdict(result), indent=2))
+    else:
+        print("{} targets, {} simulated, {} found in {:.2f}s".format(
+            result.targets, result.simulated, result.found, result.seconds))
+        for url in result.missing:
+            print("  missing {}".format(url))
+
+
+if __name__ == '__main__':
+    main()
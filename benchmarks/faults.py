@@ -0,0 +1,161 @@
+"""A TCP proxy that puts a flaky network or gateway between a projector client and its device."""
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Optional, Set, Tuple
+
+MAX_CHUNK = 4096
+
+# outage modes
+RESET = 'reset'
+HALF_OPEN = 'half_open'
+
+
+@dataclass(frozen=True)
+class FaultProfile:
+    name: str
+    # seconds added to every chunk in both directions, plus up to `jitter` more
+    latency: float = 0.0
+    jitter: float = 0.0
+    # chances per chunk coming back from the device
+    drop: float = 0.0
+    truncate: float = 0.0
+    garble: float = 0.0
+    # chance per chunk that the gateway drops the connection instead of forwarding it
+    disconnect: float = 0.0
+
+
+class _Disconnect(Exception):
+    pass
+
+
+class FaultProxy:
+    """Forwards one local port to `upstream_port` and breaks the traffic as the profile says.
+
+    Besides the per-chunk faults, `outage()` takes the gateway away for a while: `reset` drops
+    every connection and stops listening, so connects are refused until it is back; `half_open`
+    keeps connections up but lets nothing through.
+    """
+    profile: FaultProfile
+    _server: Optional[asyncio.AbstractServer]
+    _address: Optional[Tuple[str, int]]
+    _reopen_task: Optional[asyncio.Future]
+    _writers: Set[asyncio.StreamWriter]
+    _handlers_running: Set[asyncio.Task]
+
+    def __init__(self, upstream_port: int, profile: FaultProfile, seed: int = 0,
+                 upstream_host: str = '127.0.0.1') -> None:
+        self.profile = profile
+        self._upstream = (upstream_host, upstream_port)
+        self._random = random.Random(seed)
+        self._server = None
+        self._address = None
+        self._reopen_task = None
+        self._writers = set()
+        self._handlers_running = set()
+        self._outage_mode = None
+        self._outage_until = 0.0
+
+    @property
+    def port(self) -> int:
+        return self._address[1]
+
+    @property
+    def url(self) -> str:
+        return 'socket://127.0.0.1:{}'.format(self.port)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        # kept for reopening on the same port after an outage
+        self._address = (host, self._server.sockets[0].getsockname()[1])
+
+    async def stop(self) -> None:
+        if self._reopen_task is not None:
+            self._reopen_task.cancel()
+            await asyncio.wait({self._reopen_task})
+            self._reopen_task = None
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        if self._handlers_running:
+            await asyncio.wait(self._handlers_running)
+        await self._server.wait_closed()
+        self._server = None
+
+    def outage(self, seconds: float, mode: str = RESET) -> None:
+        self._outage_mode = mode
+        self._outage_until = asyncio.get_running_loop().time() + seconds
+        if mode == RESET:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            if self._reopen_task is not None:
+                self._reopen_task.cancel()
+            self._reopen_task = asyncio.ensure_future(self._reopen(seconds))
+
+    async def _reopen(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._server = await asyncio.start_server(self._serve, *self._address)
+
+    def _in_outage(self, mode: str) -> bool:
+        return self._outage_mode == mode and asyncio.get_running_loop().time() < self._outage_until
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers_running.add(task)
+        self._writers.add(writer)
+        upstream_writer = None
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self._upstream)
+            self._writers.add(upstream_writer)
+            pumps = [asyncio.ensure_future(self._pump(reader, upstream_writer, False)),
+                     asyncio.ensure_future(self._pump(upstream_reader, writer, True))]
+            # whichever side goes away first takes the other one with it
+            _, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            for pump in pending:
+                pump.cancel()
+            await asyncio.wait(pumps)
+        except (ConnectionError, OSError):
+            return
+        finally:
+            for side in (writer, upstream_writer):
+                if side is not None:
+                    self._writers.discard(side)
+                    side.close()
+            self._handlers_running.discard(task)
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, from_device: bool) -> None:
+        try:
+            while True:
+                chunk = await reader.read(MAX_CHUNK)
+                if not chunk:
+                    return
+                if self._in_outage(HALF_OPEN):
+                    continue
+                if from_device:
+                    chunk = self._mangle(chunk)
+                    if not chunk:
+                        continue
+                delay = self.profile.latency + self._random.random() * self.profile.jitter
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(chunk)
+                await writer.drain()
+        except (_Disconnect, ConnectionError, OSError):
+            return
+
+    def _mangle(self, chunk: bytes) -> bytes:
+        profile = self.profile
+        chance = self._random.random
+        if chance() < profile.disconnect:
+            raise _Disconnect()
+        if chance() < profile.drop:
+            return b''
+        if chance() < profile.truncate and len(chunk) > 1:
+            chunk = chunk[:self._random.randrange(1, len(chunk))]
+        if chance() < profile.garble:
+            position = self._random.randrange(len(chunk))
+            chunk = chunk[:position] + bytes([chunk[position] ^ 0x5a]) + chunk[position + 1:]
+        return chunk
@@ -0,0 +1,74 @@
+"""Keep more listening projectors than their gateway has permits and count how often they connect.
+
+    python -m benchmarks.listeners --projectors 5 --gateway-limit 4 --duration 6
+
+Halfway through, every projector is queried once, which moves the permits around. Listeners
+must not fight over them afterwards: each projector may connect once for listening and once
+for its query, however long the run. Exits with status 1 if the connects keep growing.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from dataclasses import asdict, dataclass
+
+from socket_projector.runtime import DEFAULT_GATEWAY_LIMIT, GatewayLimiter
+
+from .bench import _print_table, _projector
+from .simulator import SimulatorConfig, start_fleet
+
+
+@dataclass
+class ListenResult:
+    projectors: int
+    gateway_limit: int
+    seconds: float
+    connects: int
+    connects_per_second: float
+    max_connects_per_projector: int
+    flat: bool
+
+
+async def run(projectors: int, gateway_limit: int, duration: float) -> ListenResult:
+    simulators = await start_fleet(projectors, SimulatorConfig(push=True))
+    limiter = GatewayLimiter('gateway', gateway_limit)
+    fleet = [_projector(index, simulator.url, 1, limiter, listen=True) for index, simulator in enumerate(simulators)]
+    try:
+        for projector in fleet:
+            projector.start_listening(lambda is_on: None)
+        await asyncio.sleep(duration / 2)
+        await asyncio.gather(*(projector.get_state() for projector in fleet))
+        await asyncio.sleep(duration / 2)
+    finally:
+        await asyncio.gather(*(projector.close() for projector in fleet))
+        await asyncio.gather(*(simulator.stop() for simulator in simulators))
+    connects = [simulator.stats.connections for simulator in simulators]
+    return ListenResult(
+        projectors=projectors,
+        gateway_limit=gateway_limit,
+        seconds=duration,
+        connects=sum(connects),
+        connects_per_second=round(sum(connects) / duration, 2),
+        max_connects_per_projector=max(connects),
+        flat=max(connects) <= 2,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--projectors', type=int, default=5)
+    parser.add_argument('--gateway-limit', type=int, default=DEFAULT_GATEWAY_LIMIT)
+    parser.add_argument('--duration', type=float, default=6.0, help='seconds to listen')
+    parser.add_argument('--json', action='store_true', help='print the result as json')
+    args = parser.parse_args()
+    result = asyncio.run(run(args.projectors, args.gateway_limit, args.duration))
+    if args.json:
+        print(json.dumps(asdict(result), indent=2))
+    else:
+        _print_table([result])
+    if not result.flat:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
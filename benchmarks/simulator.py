@@ -0,0 +1,215 @@
+"""A BenQ style projector that speaks the `\\r*cmd#\\r` protocol over TCP.
+
+Run it on its own to point a config entry at it:
+
+    python -m benchmarks.simulator --port 4352 --echo --latency 0.02
+"""
+import argparse
+import asyncio
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+_LOGGER = logging.getLogger(__name__)
+
+FRAME = re.compile(rb'\*([^*#\r\n]*)#')
+MAX_BUFFER = 1024
+
+BLOCK_ITEM = 'Block item'
+ILLEGAL_FORMAT = 'Illegal format'
+
+
+@dataclass
+class SimulatorConfig:
+    model: str = 'W1070'
+    # answer with a copy of every command before the reply, like most BenQ firmwares do
+    echo: bool = True
+    # seconds between receiving a command and answering it
+    latency: float = 0.0
+    # seconds the lamp needs after pow=on before queries that need a running projector work
+    warm_up: float = 0.0
+    # send a `*POW=..#` frame on its own whenever the power state changes
+    push: bool = False
+    lamp_hours: int = 1234
+    source: str = 'HDMI'
+    lamp_mode: str = 'NORMAL'
+    volume: int = 5
+    muted: bool = False
+
+
+@dataclass
+class SimulatorStats:
+    connections: int = 0
+    commands: int = 0
+    unknown: int = 0
+    per_command: Dict[str, int] = field(default_factory=dict)
+
+
+class ProjectorSimulator:
+    """Serves one simulated projector; every client sees the same device state."""
+    config: SimulatorConfig
+    stats: SimulatorStats
+    _server: Optional[asyncio.AbstractServer]
+    _writers: Set[asyncio.StreamWriter]
+    _handlers_running: Set[asyncio.Task]
+
+    def __init__(self, config: Optional[SimulatorConfig] = None) -> None:
+        self.config = config or SimulatorConfig()
+        self.stats = SimulatorStats()
+        self._server = None
+        self._writers = set()
+        self._handlers_running = set()
+        self._power = False
+        self._powered_since = 0.0
+        self._volume = self.config.volume
+        self._muted = self.config.muted
+        self._handlers: Dict[str, Callable[[], str]] = {
+            'pow=?': self._power_state,
+            'pow=on': lambda: self._set_power(True),
+            'pow=off': lambda: self._set_power(False),
+            'ltim=?': lambda: 'LTIM={}'.format(self.config.lamp_hours),
+            'modelname=?': lambda: 'MODELNAME={}'.format(self.config.model),
+            'sour=?': self._needs_power(lambda: 'SOUR={}'.format(self.config.source)),
+            'lampm=?': self._needs_power(lambda: 'LAMPM={}'.format(self.config.lamp_mode)),
+            'vol=?': self._needs_power(lambda: 'VOL={}'.format(self._volume)),
+            'vol=+': self._needs_power(lambda: self._step_volume(1)),
+            'vol=-': self._needs_power(lambda: self._step_volume(-1)),
+            'mute=?': self._needs_power(lambda: 'MUTE={}'.format('ON' if self._muted else 'OFF')),
+            'mute=on': self._needs_power(lambda: self._set_mute(True)),
+            'mute=off': self._needs_power(lambda: self._set_mute(False)),
+        }
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return 'socket://127.0.0.1:{}'.format(self.port)
+
+    @property
+    def is_on(self) -> bool:
+        return self._power
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port)
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        # closed writers end the reads, let the handlers return on their own
+        if self._handlers_running:
+            await asyncio.wait(self._handlers_running)
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats.connections += 1
+        self._writers.add(writer)
+        task = asyncio.current_task()
+        self._handlers_running.add(task)
+        buffer = b''
+        try:
+            while True:
+                chunk = await reader.read(MAX_BUFFER)
+                if not chunk:
+                    return
+                buffer += chunk
+                position = 0
+                for match in FRAME.finditer(buffer):
+                    position = match.end()
+                    await self._answer(writer, match.group(1).decode('ascii', errors='replace'))
+                buffer = buffer[position:][-MAX_BUFFER:]
+        except (ConnectionError, OSError):
+            return
+        finally:
+            self._writers.discard(writer)
+            self._handlers_running.discard(task)
+            writer.close()
+
+    async def _answer(self, writer: asyncio.StreamWriter, command: str) -> None:
+        self.stats.commands += 1
+        self.stats.per_command[command] = self.stats.per_command.get(command, 0) + 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        handler = self._handlers.get(command.lower())
+        if handler is None:
+            self.stats.unknown += 1
+            reply = ILLEGAL_FORMAT
+        else:
+            reply = handler()
+        out = '*{}#\r\n'.format(command) if self.config.echo else ''
+        writer.write('{}*{}#\r\n'.format(out, reply).encode('ascii'))
+        await writer.drain()
+
+    def _warm(self) -> bool:
+        loop = asyncio.get_running_loop()
+        return self._power and loop.time() - self._powered_since >= self.config.warm_up
+
+    def _needs_power(self, handler: Callable[[], str]) -> Callable[[], str]:
+        return lambda: handler() if self._warm() else BLOCK_ITEM
+
+    def _power_state(self) -> str:
+        return 'POW={}'.format('ON' if self._power else 'OFF')
+
+    def _set_power(self, on: bool) -> str:
+        if on != self._power:
+            self._power = on
+            self._powered_since = asyncio.get_running_loop().time()
+            if self.config.push:
+                self._broadcast(self._power_state())
+        return self._power_state()
+
+    def _set_mute(self, muted: bool) -> str:
+        self._muted = muted
+        return 'MUTE={}'.format('ON' if muted else 'OFF')
+
+    def _step_volume(self, step: int) -> str:
+        self._volume = max(0, min(20, self._volume + step))
+        return 'VOL={}'.format(self._volume)
+
+    def _broadcast(self, reply: str) -> None:
+        frame = '\r\n*{}#\r\n'.format(reply).encode('ascii')
+        for writer in self._writers:
+            writer.write(frame)
+
+
+async def start_fleet(size: int, config: Optional[SimulatorConfig] = None) -> List[ProjectorSimulator]:
+    """Start `size` simulators, each on its own local port."""
+    simulators = [ProjectorSimulator(config) for _ in range(size)]
+    await asyncio.gather(*(simulator.start() for simulator in simulators))
+    return simulators
+
+
+async def _main(args: argparse.Namespace) -> None:
+    simulator = ProjectorSimulator(SimulatorConfig(echo=args.echo, latency=args.latency,
+                                                   warm_up=args.warm_up, push=args.push))
+    await simulator.start(args.host, args.port)
+    _LOGGER.info("Simulated projector listening on %s:%s", args.host, simulator.port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4352)
+    parser.add_argument('--echo', action='store_true')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--warm-up', type=float, default=0.0)
+    parser.add_argument('--push', action='store_true')
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
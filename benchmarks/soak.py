@@ -0,0 +1,157 @@
+"""Poll simulated projectors through fault-injecting proxies and report how well polling holds up.
+
+    python -m benchmarks.soak --projectors 5 --duration 40 --outage 5
+
+Every fault profile runs for `--duration` seconds. A third of the way in, every gateway goes
+away for `--outage` seconds; the time from its return to the first good poll is the recovery time.
+Degradation compares the good polls per second with the clean profile.
+"""
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence
+
+from socket_projector.metrics import CONNECT_FAILURES, ERRORS, RECONNECTS, TIMEOUTS
+
+from .bench import _percentile, _print_table, _projector
+from .faults import HALF_OPEN, RESET, FaultProfile, FaultProxy
+from .simulator import SimulatorConfig, start_fleet
+
+PROFILES = [
+    FaultProfile('clean'),
+    FaultProfile('latency', latency=0.05, jitter=0.1),
+    FaultProfile('loss', drop=0.1),
+    FaultProfile('truncation', truncate=0.1),
+    FaultProfile('garbled', garble=0.1),
+    FaultProfile('resets', disconnect=0.05),
+]
+
+# pause between the polls of one projector
+POLL_INTERVAL = 0.2
+# budget of one poll cycle, well below the default so a broken line shows up quickly
+POLL_BUDGET = 2.0
+
+
+@dataclass
+class SoakResult:
+    profile: str
+    polls: int
+    success_rate: float
+    good_polls_per_second: float
+    degradation: float
+    recovery_p50_s: Optional[float]
+    recovery_max_s: Optional[float]
+    unrecovered: int
+    timeouts: int
+    errors: int
+    reconnects: int
+    connect_failures: int
+
+
+async def _poll_until(projector, stop_at: float, log: List[tuple]) -> None:
+    loop = asyncio.get_running_loop()
+    while loop.time() < stop_at:
+        state = await projector.poll(POLL_BUDGET)
+        log.append((loop.time(), state.available and state.is_on is not None))
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def soak_profile(profile: FaultProfile,
+                       projectors: int,
+                       duration: float,
+                       outage: float,
+                       outage_mode: str = RESET,
+                       seed: int = 0) -> SoakResult:
+    simulators = await start_fleet(projectors, SimulatorConfig())
+    proxies = [FaultProxy(simulator.port, profile, seed=seed + index) for index, simulator in enumerate(simulators)]
+    await asyncio.gather(*(proxy.start() for proxy in proxies))
+    fleet = [_projector(index, proxy.url, 1, None) for index, proxy in enumerate(proxies)]
+    logs: List[List[tuple]] = [[] for _ in fleet]
+    loop = asyncio.get_running_loop()
+    try:
+        started = loop.time()
+        stop_at = started + duration
+        polling = asyncio.gather(*(_poll_until(projector, stop_at, log) for projector, log in zip(fleet, logs)))
+        outage_ends = None
+        if outage:
+            await asyncio.sleep(duration / 3)
+            for proxy in proxies:
+                proxy.outage(outage, outage_mode)
+            outage_ends = loop.time() + outage
+        await polling
+        seconds = loop.time() - started
+    finally:
+        await asyncio.gather(*(projector.close() for projector in fleet))
+        await asyncio.gather(*(proxy.stop() for proxy in proxies))
+        await asyncio.gather(*(simulator.stop() for simulator in simulators))
+
+    recoveries = []
+    unrecovered = 0
+    if outage_ends is not None:
+        for log in logs:
+            back = next((at for at, ok in log if ok and at >= outage_ends), None)
+            if back is None:
+                unrecovered += 1
+            else:
+                recoveries.append(back - outage_ends)
+    polls = sum(len(log) for log in logs)
+    good = sum(ok for log in logs for _, ok in log)
+
+    def total(counter: str) -> int:
+        return sum(projector.metrics.counter(counter) for projector in fleet)
+
+    return SoakResult(
+        profile=profile.name,
+        polls=polls,
+        success_rate=round(good / polls, 3) if polls else 0.0,
+        good_polls_per_second=round(good / seconds, 2),
+        degradation=0.0,
+        recovery_p50_s=round(_percentile(recoveries, 50), 2) if recoveries else None,
+        recovery_max_s=round(max(recoveries), 2) if recoveries else None,
+        unrecovered=unrecovered,
+        timeouts=total(TIMEOUTS),
+        errors=total(ERRORS),
+        reconnects=total(RECONNECTS),
+        connect_failures=total(CONNECT_FAILURES),
+    )
+
+
+async def run(profiles: Sequence[FaultProfile],
+              projectors: int,
+              duration: float,
+              outage: float,
+              outage_mode: str = RESET) -> List[SoakResult]:
+    results = [await soak_profile(profile, projectors, duration, outage, outage_mode) for profile in profiles]
+    # the first profile is the baseline the others are measured against
+    baseline = results[0].good_polls_per_second
+    for result in results:
+        if baseline:
+            result.degradation = round(1 - result.good_polls_per_second / baseline, 3)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', default=','.join(profile.name for profile in PROFILES),
+                        help='comma separated fault profiles, the first one is the baseline')
+    parser.add_argument('--projectors', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=40.0, help='seconds per profile')
+    parser.add_argument('--outage', type=float, default=5.0, help='seconds the gateways are away, 0 for none')
+    parser.add_argument('--outage-mode', choices=[RESET, HALF_OPEN], default=RESET)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+    by_name = {profile.name: profile for profile in PROFILES}
+    profiles = [by_name[name] for name in args.profiles.split(',')]
+    started = time.perf_counter()
+    results = asyncio.run(run(profiles, args.projectors, args.duration, args.outage, args.outage_mode))
+    if args.json:
+        print(json.dumps([asdict(result) for result in results], indent=2))
+    else:
+        _print_table(results)
+        print('soaked for {:.0f}s'.format(time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
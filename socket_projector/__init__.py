@@ -7,11 +7,16 @@ from homeassistant.helpers.typing import ConfigType
 from homeassistant.config_entries import ConfigEntry
 
 from .const import *
+from .coordinator import ProjectorCoordinator
 from .hub import Projector, ProjectorConfiguration, ProjectorStateCommandConfiguration
+from .protocol import POWER_OFF, POWER_ON, load_profile
+from .runtime import ProjectorRuntime
+from .services import async_setup_services
 
 # List of platforms to support. There should be a matching .py file for each,
-# eg <cover.py> and <sensor.py>
-PLATFORMS: list[str] = ["switch"]
+# eg <cover.py> and <sensor.py>. Every platform reads the shared ProjectorCoordinator
+# snapshot instead of talking to the device itself.
+PLATFORMS: list[str] = ["switch", "sensor"]
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
@@ -19,35 +24,65 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     # Ensure our name space for storing objects is a known type. A dict is
     # common/preferred as it allows a separate instance of your class for each
     # instance that has been created in the UI.
-    hass.data.setdefault(DOMAIN, {})
+    _get_runtime(hass)
+    async_setup_services(hass)
 
     return True
 
 
+def _get_runtime(hass: HomeAssistant) -> ProjectorRuntime:
+    """The I/O runtime every entry shares, so projectors behind one gateway respect its limits together."""
+    data = hass.data.setdefault(DOMAIN, {})
+    if DATA_RUNTIME not in data:
+        data[DATA_RUNTIME] = ProjectorRuntime()
+    return data[DATA_RUNTIME]
+
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Hello World from a config entry."""
     # Store an instance of the "connecting" class that does the work of speaking
     # with your actual devices.
 
+    profile = await hass.async_add_executor_job(load_profile, entry.data.get(CONF_PROFILE, DEFAULT_PROFILE))
+    if CONF_POW_OFF_STATE in entry.data:
+        pow_state_on_value = entry.data[CONF_POW_ON_STATE]
+        pow_state_off_value = entry.data[CONF_POW_OFF_STATE]
+    else:
+        # older entries stored the off value under the on key, the profile knows the real ones
+        pow_state_on_value = profile.power_value(POWER_ON)
+        pow_state_off_value = profile.power_value(POWER_OFF)
+
+    statecommandconfig = ProjectorStateCommandConfiguration(
+        command_template=entry.data[CONF_COMMAND_TEMPLATE],
+        response_template=entry.data[CONF_POW_STATE_TMPL],
+        pow_on_command=entry.data[CONF_POW_ON_CMD],
+        pow_off_command=entry.data[CONF_POW_OFF_CMD],
+        pow_state_query=entry.data[CONF_POW_STATE_QRY],
+        pow_state_on_value=pow_state_on_value,
+        pow_state_off_value=pow_state_off_value,
+        profile=profile
+    )
+    # compiling the response patterns is the only real work left, keep it off the loop as well
+    await hass.async_add_executor_job(getattr, statecommandconfig, 'command_table')
+
     projector_configuration = ProjectorConfiguration(
         socket_url=entry.data[CONF_SOCKET],
         timeout=entry.data[CONF_TIMEOUT],
         baudrate=entry.data[CONF_BAUDRATE],
-        statecommandconfig=ProjectorStateCommandConfiguration(
-            command_template=entry.data[CONF_COMMAND_TEMPLATE],
-            response_template=entry.data[CONF_POW_STATE_TMPL],
-            pow_on_command=entry.data[CONF_POW_ON_CMD],
-            pow_off_command=entry.data[CONF_POW_OFF_CMD],
-            pow_state_query=entry.data[CONF_POW_STATE_QRY],
-            pow_state_on_value=entry.data[CONF_POW_ON_STATE],
-            pow_state_off_value=entry.data[CONF_POW_OFF_STATE]
-        )
+        statecommandconfig=statecommandconfig,
+        echo=entry.data.get(CONF_ECHO),
+        listen=entry.data.get(CONF_LISTEN, False)
     )
 
-    hass.data[DOMAIN][entry.entry_id] = Projector(
+    projector = Projector(
         projector_id=entry.data[CONF_ID],
-        projector_configuration=projector_configuration
+        projector_configuration=projector_configuration,
+        limiter=_get_runtime(hass).limiter_for(projector_configuration.socketurl)
         )
+    coordinator = ProjectorCoordinator(hass, entry, projector)
+    hass.data[DOMAIN][entry.entry_id] = coordinator
+    # nothing here waits for the device, so a restart with many projectors does not queue up behind them
+    coordinator.async_start()
 
     # This creates each HA object for each platform your device requires.
     # It's done by calling the `async_setup_entry` function in each platform module.
@@ -74,6 +109,7 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         )
     )
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)
+        await coordinator.async_stop()
 
     return unload_ok
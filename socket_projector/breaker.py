@@ -0,0 +1,97 @@
+import random
+import time
+from typing import Callable
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_BASE_DELAY = 10.0
+DEFAULT_MAX_DELAY = 600.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stops talking to a device that keeps failing and probes it again with growing pauses.
+
+    After `failure_threshold` failures in a row the breaker opens and refuses every call.
+    Once the backoff passed, a single probe call is let through: success closes the breaker,
+    failure opens it again with the pause doubled, up to `max_delay`. Pauses are jittered
+    so a fleet that went down together does not come back in lockstep.
+    """
+    _failure_threshold: int
+    _base_delay: float
+    _max_delay: float
+    _state: str
+    _failures: int
+    _opened: int
+    _retry_at: float
+
+    def __init__(self,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY,
+                 clock: Callable[[], float] = time.monotonic,
+                 jitter: Callable[[], float] = random.random) -> None:
+        self._failure_threshold = failure_threshold
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._clock = clock
+        self._jitter = jitter
+        self._state = CLOSED
+        self._failures = 0
+        self._opened = 0
+        self._retry_at = 0.0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are refused or a probe is deciding whether they may resume."""
+        return self._state != CLOSED
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def retry_in(self) -> float:
+        """Seconds until the next probe is let through, 0 while the breaker is closed."""
+        if self._state == CLOSED:
+            return 0.0
+        return max(0.0, self._retry_at - self._clock())
+
+    def allow(self) -> bool:
+        """Whether a call may go to the device now; an open breaker lets one probe through when due."""
+        if self._state == CLOSED:
+            return True
+        now = self._clock()
+        if now < self._retry_at:
+            return False
+        self._state = HALF_OPEN
+        # a probe that never reports back must not keep the breaker shut for good
+        self._retry_at = now + self._base_delay
+        return True
+
+    def record_success(self) -> bool:
+        """Note a call that reached the device; returns True if this closed the breaker."""
+        was_open = self.is_open
+        self._state = CLOSED
+        self._failures = 0
+        self._opened = 0
+        return was_open
+
+    def record_failure(self) -> bool:
+        """Note a call that could not reach the device; returns True if this opened the breaker."""
+        self._failures += 1
+        if self._state == CLOSED and self._failures < self._failure_threshold:
+            return False
+        was_closed = self._state == CLOSED
+        delay = min(self._max_delay, self._base_delay * 2 ** self._opened)
+        self._opened += 1
+        # equal jitter: at least half the pause, never more than all of it
+        self._retry_at = self._clock() + delay / 2 + self._jitter() * delay / 2
+        self._state = OPEN
+        return was_closed
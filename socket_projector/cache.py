@@ -0,0 +1,52 @@
+import time
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+class AttributeCache:
+    """Attribute values with a lifetime per attribute.
+
+    A ttl of None marks a static value that is queried once and then kept forever.
+    Stale attributes are handed out round robin, at most `max_refresh` per poll cycle,
+    so the cost of a cycle stays bounded however many attributes are stale.
+    """
+    _ttls: Mapping[str, Optional[float]]
+    _max_refresh: int
+    _values: Dict[str, Tuple[str, float]]
+    _order: List[str]
+
+    def __init__(self,
+                 ttls: Mapping[str, Optional[float]],
+                 max_refresh: int,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._ttls = ttls
+        self._max_refresh = max_refresh
+        self._clock = clock
+        self._values = {}
+        self._order = list(ttls)
+
+    def values(self) -> Dict[str, str]:
+        return {attribute: value for attribute, (value, _) in self._values.items()}
+
+    def set(self, attribute: str, value: str) -> None:
+        self._values[attribute] = (value, self._clock())
+
+    def invalidate(self, attribute: str) -> None:
+        self._values.pop(attribute, None)
+
+    def is_stale(self, attribute: str) -> bool:
+        if attribute not in self._values:
+            return True
+        ttl = self._ttls.get(attribute)
+        if ttl is None:
+            return False
+        _, fetched = self._values[attribute]
+        return self._clock() - fetched >= ttl
+
+    def due(self, candidates: Iterable[str]) -> List[str]:
+        """Pick the stale attributes to refresh this cycle, oldest turn first."""
+        allowed = set(candidates)
+        picked = [attribute for attribute in self._order
+                  if attribute in allowed and self.is_stale(attribute)][:self._max_refresh]
+        # the picked ones go to the back of the line so the others get their turn next cycle
+        self._order = [attribute for attribute in self._order if attribute not in picked] + picked
+        return picked
@@ -1,43 +1,92 @@
 from homeassistant import config_entries, data_entry_flow, exceptions
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
-from typing import Any, Optional
+from typing import Any, List, Optional
 from urllib.parse import urlparse
 import voluptuous as vol
 import logging
-import serial
-import re
 
 from .const import *
+from serial import SerialException
+
+from .discovery import DEFAULT_PORTS, DiscoveredProjector, async_discover, hosts_of, parse_ports
+from .probe import async_probe
+from .protocol import POWER_OFF, POWER_ON, ProtocolProfile, load_profile
 
 _LOGGER = logging.getLogger(__name__)
 
 
 async def validate_input(hass: HomeAssistant, data: dict) -> dict[str, Any]:
+    """Probe the device behind the url and report what answered.
+
+    The profile and baud rate in `data` are tried first, the other candidates after them.
+    """
     url = data[CONF_SOCKET]
-    if not urlparse(url).scheme in ['http', 'socket']:
+    scheme = urlparse(url).scheme
+    if scheme and scheme not in ['socket', 'rfc2217']:
         raise InvalidHost
 
-    ser = None
-    modelname = None
-    normalized_ip = None
+    first_profile = data.get(CONF_PROFILE, DEFAULT_PROFILE)
+    first_baudrate = data.get(CONF_BAUDRATE, BAUDRATES_BY_USE[0])
+    profiles = await hass.async_add_executor_job(
+        _load_profiles, [first_profile] + [name for name in PROFILES if name != first_profile])
+    baudrates = [first_baudrate] + [baudrate for baudrate in BAUDRATES_BY_USE if baudrate != first_baudrate]
     try:
-        ser = serial.serial_for_url(data[CONF_SOCKET],
-                                    baudrate=data[CONF_BAUDRATE],
-                                    timeout=data[CONF_TIMEOUT],
-                                    write_timeout=data[CONF_TIMEOUT])
-        ser.write('\r*modelname=?#\r'.encode('ascii'))
-        ser.read_until()
-        ret = ser.read_until().decode('ascii')
-        modelname = re.match(r'\*MODELNAME=(.+)#', ret).group(1)
-        normalized_ip = re.match(r'(\d+\.\d+\.\d+\.\d+)', data[CONF_SOCKET].split('://')[-1]).group(1).replace('.', '')
-    finally:
-        if ser is not None and ser.is_open:
-            ser.close()
+        result = await async_probe(url, profiles, baudrates, max_timeout=data[CONF_TIMEOUT])
+    except (SerialException, ValueError) as exc:
+        # pyserial rejects urls it cannot parse with a ValueError
+        _LOGGER.debug('Could not open %s: %s', url, exc)
+        raise InvalidHost from exc
+    if result is None:
+        raise NoProjectorFound
+    _LOGGER.debug('Found %s in %.2fs.', result, result.seconds)
 
     return {
-        CONF_ID: modelname + normalized_ip,
-        'title': 'Projector ' + modelname,
+        CONF_ID: _unique_id(result.model, url),
+        CONF_PROFILE: result.profile,
+        CONF_BAUDRATE: result.baudrate,
+        CONF_ECHO: result.echo,
+        'model': result.model,
+        'title': 'Projector ' + result.model,
+    }
+
+
+async def discover_projectors(hass: HomeAssistant, data: dict) -> List[DiscoveredProjector]:
+    """Scan the subnet and ports in `data` for projectors."""
+    try:
+        ports = parse_ports(data[CONF_PORTS])
+    except ValueError as exc:
+        raise InvalidPorts from exc
+    try:
+        hosts = hosts_of(data[CONF_SUBNET], len(ports))
+    except ValueError as exc:
+        raise InvalidSubnet from exc
+    profiles = await hass.async_add_executor_job(_load_profiles, PROFILES)
+    try:
+        return await async_discover(hosts, ports, profiles, BAUDRATES_BY_USE[:1], timeout=data[CONF_TIMEOUT])
+    except ValueError as exc:
+        raise InvalidSubnet from exc
+
+
+def _unique_id(model: str, url: str) -> str:
+    parsed = urlparse(url)
+    return model + ''.join(char for char in parsed.hostname or parsed.path if char.isalnum())
+
+
+def _load_profiles(names: List[str]) -> List[ProtocolProfile]:
+    return [load_profile(name) for name in names]
+
+
+def _state_defaults(profile: ProtocolProfile) -> dict[str, str]:
+    """The advanced state settings as the profile declares them."""
+    return {
+        CONF_COMMAND_TEMPLATE: profile.command_template,
+        CONF_POW_ON_CMD: profile.power_on,
+        CONF_POW_OFF_CMD: profile.power_off,
+        CONF_POW_STATE_QRY: profile.power_query,
+        CONF_POW_STATE_TMPL: profile.power_answer,
+        CONF_POW_ON_STATE: profile.power_value(POWER_ON),
+        CONF_POW_OFF_STATE: profile.power_value(POWER_OFF),
     }
 
 
@@ -55,8 +104,7 @@ class BenqProjectorOptionsFlow(config_entries.OptionsFlow):
         return self.async_show_form(step_id='init',
                                     data_schema=vol.Schema({
                                         vol.Optional(CONF_NAME, default=self.config_entry.options.get(CONF_NAME)): str,
-                                        vol.Optional(CONF_BAUDRATE, default=self.config_entry.options.get(CONF_BAUDRATE)): vol.In(
-                                            [2400, 4800, 9600, 14400, 19200, 38400, 57600, 115200]),
+                                        vol.Optional(CONF_BAUDRATE, default=self.config_entry.options.get(CONF_BAUDRATE)): vol.In(BAUDRATES),
                                         vol.Optional(CONF_TIMEOUT, default=self.config_entry.options.get(CONF_TIMEOUT)): vol.All(int, vol.Range(1, 10))
                                     }),
                                     errors=errors)
@@ -64,43 +112,130 @@ class BenqProjectorOptionsFlow(config_entries.OptionsFlow):
 
 class BenqProjectorConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     init_info: Optional[dict[str, Any]]
+    discovered: dict[str, DiscoveredProjector]
 
     def __init__(self):
         self.init_info = {}
+        self.discovered = {}
 
     """Config flow for a Benq projector connected via Serial"""
 
     async def async_step_user(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
+        return self.async_show_menu(step_id='user', menu_options=['manual', 'scan'])
+
+    async def async_step_scan(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
+        """Look for serial-over-IP gateways with a projector behind them."""
+        errors = {}
+        if user_input is not None:
+            try:
+                found = await discover_projectors(self.hass, user_input)
+            except InvalidSubnet:
+                errors[CONF_SUBNET] = 'invalid_subnet'
+            except InvalidPorts:
+                errors[CONF_PORTS] = 'invalid_ports'
+            except Exception:
+                _LOGGER.exception('Unexpected exception.')
+                errors['base'] = 'unknown'
+            else:
+                configured = self._async_current_ids()
+                self.discovered = {projector.url: projector for projector in found
+                                   if _unique_id(projector.model, projector.url) not in configured}
+                self.init_info = {CONF_TIMEOUT: user_input[CONF_TIMEOUT]}
+                if self.discovered:
+                    return await self.async_step_pick()
+                errors['base'] = 'no_projector'
+
+        return self.async_show_form(step_id='scan',
+                                    data_schema=vol.Schema({
+                                        vol.Required(CONF_SUBNET, msg='Subnet, e.g. 192.168.1.0/24'): str,
+                                        vol.Optional(CONF_PORTS, msg='Ports', default=', '.join(map(str, DEFAULT_PORTS))): str,
+                                        vol.Optional(CONF_TIMEOUT, msg='Timeout', default=1): vol.All(int, vol.Range(1, 10)),
+                                    }),
+                                    errors=errors)
+
+    async def async_step_pick(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
+        """List the projectors a scan found and set up the chosen one."""
+        if user_input is not None:
+            projector = self.discovered[user_input[CONF_SOCKET]]
+            await self.async_set_unique_id(_unique_id(projector.model, projector.url))
+            self._abort_if_unique_id_configured()
+            self.init_info = {**self.init_info,
+                              CONF_SOCKET: projector.url,
+                              CONF_ID: _unique_id(projector.model, projector.url),
+                              CONF_NAME: 'Projector ' + projector.model,
+                              CONF_PROFILE: projector.profile,
+                              CONF_BAUDRATE: BAUDRATES_BY_USE[0],
+                              CONF_ECHO: projector.echo,
+                              CONF_LISTEN: user_input[CONF_LISTEN],
+                              CONF_FLOW_COMMAND_SWITCH: user_input[CONF_FLOW_COMMAND_SWITCH],
+                              'model': projector.model,
+                              'title': 'Projector ' + projector.model}
+            return await self.async_step_detected()
+
+        choices = {url: '{} ({}, {})'.format(projector.model, projector.profile, url)
+                   for url, projector in self.discovered.items()}
+        return self.async_show_form(step_id='pick',
+                                    data_schema=vol.Schema({
+                                        vol.Required(CONF_SOCKET, msg='Projector', default=next(iter(choices))): vol.In(choices),
+                                        vol.Optional(CONF_LISTEN, msg='Listen for pushed state changes?', default=False): bool,
+                                        vol.Optional(CONF_FLOW_COMMAND_SWITCH, msg='Advanced configuration?', default=False): bool
+                                    }))
+
+    async def async_step_manual(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
         errors = {}
         if user_input is not None:
             try:
                 info = await validate_input(self.hass, user_input)
                 await self.async_set_unique_id(info[CONF_ID])
                 self._abort_if_unique_id_configured()
-                user_input[CONF_ID] = info[CONF_ID]
-                if user_input[CONF_FLOW_COMMAND_SWITCH]:
-                    user_input['title'] = info['title']
-                    self.init_info = user_input
-                    return await self.async_step_user_state()
-                final_userinput_dict = {**user_input, **CONF_STATE_DEFAULTS}
-                _LOGGER.debug('Finished configuration with the following values: \n%s', final_userinput_dict)
-                return self.async_create_entry(title=info['title'], data=final_userinput_dict)
+                self.init_info = {**user_input,
+                                  CONF_ID: info[CONF_ID],
+                                  CONF_PROFILE: info[CONF_PROFILE],
+                                  CONF_BAUDRATE: info[CONF_BAUDRATE],
+                                  CONF_ECHO: info[CONF_ECHO],
+                                  'model': info['model'],
+                                  'title': info['title']}
+                return await self.async_step_detected()
             except InvalidHost:
                 errors['host'] = 'cannot_connect'
+            except NoProjectorFound:
+                errors['base'] = 'no_projector'
             except Exception:
                 _LOGGER.exception('Unexpected exception.')
                 errors['base'] = 'unknown'
 
-        return self.async_show_form(step_id='user',
+        return self.async_show_form(step_id='manual',
                                     data_schema=vol.Schema({
                                         vol.Required(CONF_SOCKET, msg='Socket'): str,
+                                        vol.Optional(CONF_PROFILE, msg='Protocol to try first', default=DEFAULT_PROFILE): vol.In(PROFILES),
                                         vol.Optional(CONF_NAME, msg='Name', default='My projector'): str,
-                                        vol.Optional(CONF_BAUDRATE, msg='Baudrate', default=9600): vol.In([2400, 4800, 9600, 14400, 19200, 38400, 57600, 115200]),
+                                        vol.Optional(CONF_BAUDRATE, msg='Baudrate to try first', default=9600): vol.In(BAUDRATES),
                                         vol.Optional(CONF_TIMEOUT, msg='Timeout', default=1): vol.All(int, vol.Range(1, 10)),
+                                        vol.Optional(CONF_LISTEN, msg='Listen for pushed state changes?', default=False): bool,
                                         vol.Optional(CONF_FLOW_COMMAND_SWITCH, msg='Advanced configuration?', default=False): bool
                                     }),
                                     errors=errors)
 
+    async def async_step_detected(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
+        """Show what the probe found and let the user correct it."""
+        if user_input is not None:
+            self.init_info = {**self.init_info, **user_input}
+            if self.init_info[CONF_FLOW_COMMAND_SWITCH]:
+                return await self.async_step_user_state()
+            profile = await self.hass.async_add_executor_job(load_profile, self.init_info[CONF_PROFILE])
+            final_userinput_dict = {**self.init_info, **_state_defaults(profile)}
+            _LOGGER.debug('Finished configuration with the following values: \n%s', final_userinput_dict)
+            return self.async_create_entry(title=self.init_info['title'], data=final_userinput_dict)
+
+        return self.async_show_form(step_id='detected',
+                                    data_schema=vol.Schema({
+                                        vol.Optional(CONF_NAME, msg='Name', default=self.init_info[CONF_NAME]): str,
+                                        vol.Optional(CONF_PROFILE, msg='Protocol', default=self.init_info[CONF_PROFILE]): vol.In(PROFILES),
+                                        vol.Optional(CONF_BAUDRATE, msg='Baudrate', default=self.init_info[CONF_BAUDRATE]): vol.In(BAUDRATES),
+                                        vol.Optional(CONF_ECHO, msg='Device echoes commands', default=self.init_info[CONF_ECHO]): bool,
+                                    }),
+                                    description_placeholders={'model': self.init_info['model']})
+
     async def async_step_user_state(self, user_input: Optional[dict[str, Any]] = None) -> data_entry_flow.FlowResult:
         errors = {}
         if user_input is not None:
@@ -108,15 +243,17 @@ class BenqProjectorConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             _LOGGER.debug('Finished configuration with the following values: \n%s', final_userinput_dict)
             return self.async_create_entry(title=self.init_info['title'], data=final_userinput_dict)
 
+        profile = await self.hass.async_add_executor_job(load_profile, self.init_info[CONF_PROFILE])
+        defaults = _state_defaults(profile)
         return self.async_show_form(step_id='user_state',
                                     data_schema=vol.Schema({
-                                        vol.Required(CONF_COMMAND_TEMPLATE, msg='Command template', default=CONF_STATE_DEFAULTS[CONF_COMMAND_TEMPLATE]): str,
-                                        vol.Required(CONF_POW_ON_CMD, msg='Power on command', default=CONF_STATE_DEFAULTS[CONF_POW_ON_CMD]): str,
-                                        vol.Required(CONF_POW_OFF_CMD, msg='Power off command', default=CONF_STATE_DEFAULTS[CONF_POW_OFF_CMD]): str,
-                                        vol.Required(CONF_POW_STATE_QRY, msg='Power state query command.', default=CONF_STATE_DEFAULTS[CONF_POW_STATE_QRY]): str,
-                                        vol.Required(CONF_POW_STATE_TMPL, msg='Power state answer template.', default=CONF_STATE_DEFAULTS[CONF_POW_STATE_TMPL]): str,
-                                        vol.Required(CONF_POW_ON_STATE, msg='Power state ON group value.', default=CONF_STATE_DEFAULTS[CONF_POW_ON_STATE]): str,
-                                        vol.Required(CONF_POW_OFF_STATE, msg='Power state OFF group value.', default=CONF_STATE_DEFAULTS[CONF_POW_OFF_STATE]): str,
+                                        vol.Required(CONF_COMMAND_TEMPLATE, msg='Command template', default=defaults[CONF_COMMAND_TEMPLATE]): str,
+                                        vol.Required(CONF_POW_ON_CMD, msg='Power on command', default=defaults[CONF_POW_ON_CMD]): str,
+                                        vol.Required(CONF_POW_OFF_CMD, msg='Power off command', default=defaults[CONF_POW_OFF_CMD]): str,
+                                        vol.Required(CONF_POW_STATE_QRY, msg='Power state query command.', default=defaults[CONF_POW_STATE_QRY]): str,
+                                        vol.Required(CONF_POW_STATE_TMPL, msg='Power state answer template.', default=defaults[CONF_POW_STATE_TMPL]): str,
+                                        vol.Required(CONF_POW_ON_STATE, msg='Power state ON group value.', default=defaults[CONF_POW_ON_STATE]): str,
+                                        vol.Required(CONF_POW_OFF_STATE, msg='Power state OFF group value.', default=defaults[CONF_POW_OFF_STATE]): str,
                                     }),
                                     errors=errors)
 
@@ -127,3 +264,15 @@ class BenqProjectorConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 
 class InvalidHost(exceptions.HomeAssistantError):
     """Error to indicate there is an invalid hostname."""
+
+
+class NoProjectorFound(exceptions.HomeAssistantError):
+    """Error to indicate that no probed protocol and baud rate got an answer."""
+
+
+class InvalidSubnet(exceptions.HomeAssistantError):
+    """Error to indicate a subnet that is malformed or too large to scan."""
+
+
+class InvalidPorts(exceptions.HomeAssistantError):
+    """Error to indicate a port list that cannot be read."""
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from logging import Logger
+from typing import AsyncIterator, Callable, Optional
+
+from serial import SerialException
+
+from .metrics import CONNECT, CONNECT_FAILURES, CONNECTS, RECONNECTS
+from .runtime import GatewayLimiter
+from .transport import ProjectorTransport
+
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+class ConnectionManager:
+    """Keeps one connection to a projector open between commands.
+
+    With a GatewayLimiter the connection holds one of the gateway's permits while it is open,
+    and an idle connection is closed early as soon as another projector waits for a permit.
+    """
+    _transport: ProjectorTransport
+    _limiter: Optional[GatewayLimiter]
+    _idle_timeout: float
+    _idle_handle: Optional[asyncio.TimerHandle]
+    _idle_close_task: Optional[asyncio.Future]
+    _in_use: int
+    _available: bool
+    _connected_before: bool
+    _preempt_handler: Optional[Callable[[], None]]
+    __logger: Logger
+
+    def __init__(self,
+                 transport: ProjectorTransport,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 limiter: Optional[GatewayLimiter] = None) -> None:
+        self._transport = transport
+        self._limiter = limiter
+        self._idle_timeout = idle_timeout
+        self._idle_handle = None
+        self._idle_close_task = None
+        self._in_use = 0
+        self._available = False
+        self._connected_before = False
+        self._preempt_handler = None
+        self.__logger = logging.getLogger(__name__)
+
+    @property
+    def transport(self) -> ProjectorTransport:
+        return self._transport
+
+    @property
+    def preempt_handler(self) -> Optional[Callable[[], None]]:
+        """Called instead of closing when a session that can step aside holds a wanted permit."""
+        return self._preempt_handler
+
+    @preempt_handler.setter
+    def preempt_handler(self, handler: Optional[Callable[[], None]]) -> None:
+        self._preempt_handler = handler
+        if handler is not None and self._limiter is not None and self._limiter.waiting:
+            # the pressure was signalled before this session could hear it
+            handler()
+
+    @property
+    def can_connect_now(self) -> bool:
+        """Whether a session would start without waiting for a gateway permit."""
+        return self._limiter is None or self._limiter.free_for(self)
+
+    @property
+    def available(self) -> bool:
+        """True while the last connection attempt succeeded and the line did not break since."""
+        return self._available
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[ProjectorTransport]:
+        """Hand out the open transport, connecting lazily if needed."""
+        self._cancel_idle_timer()
+        self._in_use += 1
+        try:
+            if self._idle_close_task is not None:
+                # waited for, not awaited: a cancelled session must not cancel the close half way
+                await asyncio.wait({self._idle_close_task})
+                self._idle_close_task = None
+            if not self._transport.is_open:
+                self.__logger.debug("Connecting to %s.", self._transport.url)
+                await self._open()
+            self._available = True
+            yield self._transport
+        finally:
+            self._in_use -= 1
+            if not self._transport.is_open:
+                # the command dropped a broken line, reconnect on next use
+                self._available = False
+                self._release_permit()
+            elif self._in_use == 0:
+                if self._limiter is not None and self._limiter.waiting:
+                    self._hand_back()
+                else:
+                    self._arm_idle_timer()
+
+    async def _open(self) -> None:
+        metrics = self._transport.metrics
+        if self._limiter is not None:
+            await self._limiter.acquire(self, self._on_pressure)
+        try:
+            with metrics.timed(CONNECT):
+                await self._transport.open()
+        except SerialException as exc:
+            self._available = False
+            self._release_permit()
+            metrics.increment(CONNECT_FAILURES)
+            self._transport.trace.event(str(exc))
+            raise
+        metrics.increment(CONNECTS)
+        self._transport.trace.event('connected')
+        if self._connected_before and not self._available:
+            # the line broke since the last command, idle closes do not count
+            metrics.increment(RECONNECTS)
+        self._connected_before = True
+
+    async def close(self) -> None:
+        self._cancel_idle_timer()
+        if self._idle_close_task is not None:
+            await asyncio.wait({self._idle_close_task})
+            self._idle_close_task = None
+        await self._close_transport()
+
+    async def _close_transport(self) -> None:
+        try:
+            if self._transport.is_open:
+                await self._transport.close()
+                self._transport.trace.event('closed')
+        finally:
+            self._release_permit()
+
+    def _release_permit(self) -> None:
+        if self._limiter is not None:
+            self._limiter.release(self)
+
+    def _arm_idle_timer(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._idle_handle = loop.call_later(self._idle_timeout, self._on_idle)
+
+    def _cancel_idle_timer(self) -> None:
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _on_idle(self) -> None:
+        self._idle_handle = None
+        closing = self._idle_close_task is not None and not self._idle_close_task.done()
+        if self._in_use == 0 and self._transport.is_open and not closing:
+            self.__logger.debug("Closing idle connection to %s.", self._transport.url)
+            self._idle_close_task = asyncio.ensure_future(self._close_transport())
+
+    def _on_pressure(self) -> None:
+        """Another projector waits for a gateway permit, hand ours back if we are not using it."""
+        if self._in_use == 0:
+            self._hand_back()
+        elif self._preempt_handler is not None:
+            self._preempt_handler()
+
+    def _hand_back(self) -> None:
+        """Close the unused connection and give its permit to the waiting projector right away."""
+        self._cancel_idle_timer()
+        self._on_idle()
+        # the close is under way, the waiter does not have to wait for it to finish
+        self._release_permit()
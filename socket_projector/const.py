@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from datetime import timedelta
 from typing import Final
 
 DOMAIN: Final = 'socket_projector'
@@ -10,36 +11,66 @@ CONF_TIMEOUT: Final = 'timeout'
 CONF_SOCKET: Final = 'socket'
 CONF_NAME: Final = 'name'
 CONF_ID: Final = 'id'
+CONF_ECHO: Final = 'echo'
+CONF_LISTEN: Final = 'listen'
+CONF_PROFILE: Final = 'profile'
+# discovery scan input, not stored in entries
+CONF_SUBNET: Final = 'subnet'
+CONF_PORTS: Final = 'ports'
 
 CONF_FLOW_COMMAND_SWITCH: Final = 'conf_flow_details'
 
+# hass.data[DOMAIN] key of the ProjectorRuntime shared by all entries
+DATA_RUNTIME: Final = 'runtime'
+
 ICON: Final = 'mdi:projector'
 
+SCAN_INTERVAL: Final = timedelta(seconds=30)
+# seconds one poll cycle may spend on the device, keep it well below SCAN_INTERVAL
+POLL_BUDGET: Final = 10.0
+# safety net interval while pushed state frames keep the entities current
+PUSH_SCAN_INTERVAL: Final = timedelta(minutes=5)
+# seconds power requests are collected before the last one is sent
+POWER_DEBOUNCE: Final = 0.5
+
 CONF_COMMAND_TEMPLATE: Final = 'command_template'
 CONF_POW_ON_CMD: Final = 'pow_on_command'
 CONF_POW_OFF_CMD: Final = 'pow_off_command'
 CONF_POW_STATE_QRY: Final = 'pow_state_query'
 CONF_POW_STATE_TMPL: Final = 'pow_state_template'
 CONF_POW_ON_STATE: Final = 'pow_on_state'
-CONF_POW_OFF_STATE: Final = 'pow_on_state'
-
-CONF_STATE_DEFAULTS: Final = {
-    CONF_COMMAND_TEMPLATE: '\r*{}#\r',
-    CONF_POW_ON_CMD: 'pow=on',
-    CONF_POW_OFF_CMD: 'pow=off',
-    CONF_POW_STATE_QRY: 'pow=?',
-    CONF_POW_STATE_TMPL: r'\*POW=(ON|OFF)#',
-    CONF_POW_ON_STATE: 'ON',
-    CONF_POW_OFF_STATE: 'OFF',
-}
+CONF_POW_OFF_STATE: Final = 'pow_off_state'
+
+BAUDRATES: Final = [2400, 4800, 9600, 14400, 19200, 38400, 57600, 115200]
+# probe order, the rates projectors ship with most often first
+BAUDRATES_BY_USE: Final = [9600, 115200, 19200, 38400, 57600, 4800, 2400, 14400]
+
+# protocol profiles shipped in protocols/<name>.json, see protocol.py
+PROFILES: Final = ['benq', 'epson', 'pjlink']
+DEFAULT_PROFILE: Final = 'benq'
 
 # attributes
 LAMP: Final = 'Lamp'
 LAMP_HOURS: Final = 'Lamp Hours'
 INPUT_SOURCE: Final = 'Input Source'
 MODEL: Final = 'Model'
-LAMP_MODE: Final = 'Lamp Mode',
-VOLUME: Final = 'Volume',
+LAMP_MODE: Final = 'Lamp Mode'
+VOLUME: Final = 'Volume'
 MUTED: Final = 'Muted'
+SERIAL_NUMBER: Final = 'Serial Number'
 
 CUSTOM_ATTRIBUTES: Final = [LAMP_HOURS, INPUT_SOURCE, MODEL, LAMP_MODE, VOLUME, MUTED]
+
+# attribute -> seconds a value stays fresh, None for values that never change;
+# the default for profiles that do not set a ttl themselves
+ATTRIBUTE_TTLS: Final = {
+    LAMP_HOURS: 3600,
+    INPUT_SOURCE: 30,
+    MODEL: None,
+    SERIAL_NUMBER: None,
+    LAMP_MODE: 300,
+    VOLUME: 60,
+    MUTED: 60,
+}
+
+MAX_ATTRIBUTE_QUERIES_PER_POLL: Final = 2
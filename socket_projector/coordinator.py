@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import dataclasses
+import logging
+from typing import Optional
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+
+from .const import CONF_ECHO, DOMAIN, PUSH_SCAN_INTERVAL, SCAN_INTERVAL
+from .deadline import Deadline
+from .hub import Projector, ProjectorState
+from .metrics import SERVICE_CALL, UPDATE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ProjectorCoordinator(DataUpdateCoordinator[ProjectorState]):
+    """Polls one projector once per cycle and shares the snapshot with all its entities."""
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry, projector: Projector) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=f'{DOMAIN} {projector.projector_id}',
+            update_interval=PUSH_SCAN_INTERVAL if projector.projector_configuration.listen else SCAN_INTERVAL,
+        )
+        self.projector = projector
+        self._entry = entry
+        self._first_refresh: Optional[asyncio.Future] = None
+        self._reconcile_refresh: Optional[asyncio.Future] = None
+        self._stopped = False
+
+    @callback
+    def async_start(self) -> None:
+        """Connect and fetch the first snapshot in the background, entities show up before it is in."""
+        if self.projector.projector_configuration.listen:
+            self.projector.start_listening(self.async_set_power)
+        self._first_refresh = self.hass.async_create_task(self.async_refresh())
+
+    async def async_stop(self) -> None:
+        # power confirmations that resolve while the projector closes must not start another refresh
+        self._stopped = True
+        for task in (self._first_refresh, self._reconcile_refresh):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.wait({task})
+        self._first_refresh = None
+        self._reconcile_refresh = None
+        await self.projector.close()
+
+    async def _async_update_data(self) -> ProjectorState:
+        with self.projector.metrics.timed(UPDATE):
+            state = await self.projector.poll()
+        self._async_store_echo_mode()
+        pending = self.projector.pending_power
+        if pending is not None:
+            # a poll that ran before the power command went out must not undo the optimistic state
+            state = dataclasses.replace(state, is_on=pending)
+        return state
+
+    @callback
+    def _async_store_echo_mode(self) -> None:
+        """Keep a detected echo mode in the config entry so it is known right from the next start."""
+        echo = self.projector.echo
+        if echo is None or self._entry.data.get(CONF_ECHO) == echo:
+            return
+        self.hass.config_entries.async_update_entry(self._entry, data={**self._entry.data, CONF_ECHO: echo})
+
+    @callback
+    def async_set_power(self, is_on: bool) -> None:
+        """Publish a power change made by a command or pushed by the device without waiting for the next poll."""
+        power_state = self.projector.power_state
+        if self.data is None or (self.data.is_on, self.data.power_state) == (is_on, power_state):
+            return
+        self.async_set_updated_data(dataclasses.replace(self.data, is_on=is_on, power_state=power_state))
+
+    @callback
+    def async_request_power(self, is_on: bool, deadline: Optional[Deadline] = None) -> asyncio.Future:
+        """Show the requested power state right away and reconcile it once the projector confirmed.
+
+        Returns the confirmation, see Projector.request_power. The SERVICE_CALL timing runs from
+        the request to that confirmation.
+        """
+        requested = self.hass.loop.time()
+        confirmation = self.projector.request_power(is_on, deadline)
+        self.async_set_power(is_on)
+        confirmation.add_done_callback(
+            lambda _: self.projector.metrics.observe(SERVICE_CALL, self.hass.loop.time() - requested))
+        confirmation.add_done_callback(self._async_reconcile_power)
+        return confirmation
+
+    @callback
+    def _async_reconcile_power(self, confirmation: asyncio.Future) -> None:
+        if self._stopped:
+            return
+        if self.projector.pending_power is not None or confirmation.cancelled():
+            # a newer request is on its way and will reconcile itself
+            return
+        confirmed = confirmation.result()
+        if confirmed is not None:
+            self.async_set_power(confirmed)
+        elif not self.projector.available:
+            self.async_set_unavailable()
+        elif self._reconcile_refresh is None or self._reconcile_refresh.done():
+            self._reconcile_refresh = self.hass.async_create_task(self.async_request_refresh())
+
+    @callback
+    def async_set_unavailable(self) -> None:
+        """Publish that the circuit breaker gave up on the device without waiting for the next poll."""
+        if self.data is None or not self.data.available:
+            return
+        self.async_set_updated_data(dataclasses.replace(self.data, available=False))
@@ -0,0 +1,23 @@
+import time
+from typing import Callable
+
+
+class Deadline:
+    """A time budget shared by every command of one poll cycle."""
+    __slots__ = ('_expires', '_clock')
+
+    def __init__(self, budget: float, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._expires = clock() + budget
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self._expires - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self._clock() >= self._expires
+
+    def cap(self, timeout: float) -> float:
+        """Shorten `timeout` so it ends no later than the deadline."""
+        return min(timeout, self.remaining)
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+from .coordinator import ProjectorCoordinator
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the configuration, the last snapshot, the metrics and the wire trace of one projector."""
+    coordinator: ProjectorCoordinator = hass.data[DOMAIN][entry.entry_id]
+    projector = coordinator.projector
+    state = coordinator.data
+    return {
+        'entry': dict(entry.data),
+        'profile': projector.projector_configuration.statecommandconfig.profile.name,
+        'state': None if state is None else {
+            'available': state.available,
+            'is_on': state.is_on,
+            'attributes': dict(state.attributes),
+            'stale_attributes': sorted(state.stale_attributes),
+        },
+        'connection': {
+            'available': projector.available,
+            'echo': projector.echo,
+            'listening': projector.listening,
+            'breaker': projector.breaker.state,
+            'breaker_retry_in': round(projector.breaker.retry_in, 1),
+        },
+        'metrics': projector.metrics.as_dict(),
+        'wire_trace': {
+            'recorded': projector.trace.recorded,
+            'records': projector.trace.dump(),
+        },
+    }
@@ -0,0 +1,126 @@
+import asyncio
+import ipaddress
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence
+
+from serial import SerialException
+
+from .probe import async_probe
+from .protocol import ProtocolProfile
+
+_LOGGER = logging.getLogger(__name__)
+
+# ports serial-over-IP gateways listen on out of the box
+DEFAULT_PORTS = [23, 4001, 4352, 8899, 10001]
+DISCOVERY_CONCURRENCY = 128
+# an open port on the local network accepts well within this
+CONNECT_TIMEOUT = 0.5
+# a /22 with a handful of ports is the most a config flow should wait for
+MAX_TARGETS = 8192
+
+
+@dataclass(frozen=True)
+class DiscoveredProjector:
+    url: str
+    host: str
+    port: int
+    profile: str
+    model: str
+    echo: bool
+
+
+def parse_ports(ports: str) -> List[int]:
+    """Read `23, 4001, 10001-10004` into a sorted list of ports, raises ValueError on anything else."""
+    result = set()
+    for part in ports.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        start = int(first)
+        end = int(last) if last else start
+        if not 0 < start <= end <= 65535:
+            raise ValueError("invalid port range {!r}".format(part))
+        result.update(range(start, end + 1))
+    if not result:
+        raise ValueError("no ports given")
+    return sorted(result)
+
+
+def hosts_of(subnet: str, ports: int = 1) -> List[str]:
+    """Every host address of the IPv4 `subnet`, a single address counts as its own /32.
+
+    Raises ValueError before listing anything if scanning `ports` ports on each address
+    would take more than MAX_TARGETS connects.
+    """
+    network = ipaddress.ip_network(subnet.strip(), strict=False)
+    if network.version != 4:
+        raise ValueError("only IPv4 subnets can be scanned, got {}".format(network))
+    if network.num_addresses * ports > MAX_TARGETS:
+        raise ValueError("{} addresses of {} times {} ports are more than the {} targets allowed".format(
+            network.num_addresses, network, ports, MAX_TARGETS))
+    if network.num_addresses == 1:
+        return [str(network.network_address)]
+    return [str(host) for host in network.hosts()]
+
+
+async def _port_open(host: str, port: int) -> bool:
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def _discover_one(host: str,
+                        port: int,
+                        profiles: Sequence[ProtocolProfile],
+                        baudrates: Sequence[int],
+                        timeout: float) -> Optional[DiscoveredProjector]:
+    if not await _port_open(host, port):
+        return None
+    url = 'socket://{}:{}'.format(host, port)
+    try:
+        result = await async_probe(url, profiles, baudrates, max_timeout=timeout)
+    except SerialException as exc:
+        # something listens there, but hangs up on projector commands
+        _LOGGER.debug("%s is open but not a projector: %s", url, exc)
+        return None
+    if result is None:
+        return None
+    return DiscoveredProjector(url=url, host=host, port=port, profile=result.profile, model=result.model,
+                               echo=result.echo)
+
+
+async def async_discover(hosts: Iterable[str],
+                         ports: Sequence[int],
+                         profiles: Sequence[ProtocolProfile],
+                         baudrates: Sequence[int],
+                         timeout: float = 1.0,
+                         concurrency: int = DISCOVERY_CONCURRENCY) -> List[DiscoveredProjector]:
+    """Look for projectors on every host and port pair, at most `concurrency` of them at once.
+
+    Closed ports cost one refused or timed out connect; only open ports get the identify query
+    of every profile. Results come sorted by host and port.
+    """
+    targets = [(host, port) for host in hosts for port in ports]
+    if len(targets) > MAX_TARGETS:
+        raise ValueError("{} targets to scan, at most {} allowed".format(len(targets), MAX_TARGETS))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(host: str, port: int) -> Optional[DiscoveredProjector]:
+        async with semaphore:
+            return await _discover_one(host, port, profiles, baudrates, timeout)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(*(bounded(host, port) for host, port in targets))
+    found = [result for result in results if result is not None]
+    _LOGGER.debug("Scanned %d targets in %.2fs, found %d projectors.", len(targets), loop.time() - started,
+                  len(found))
+    return sorted(found, key=lambda projector: (ipaddress.ip_address(projector.host), projector.port))
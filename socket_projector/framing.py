@@ -0,0 +1,91 @@
+from typing import Optional
+
+FRAME_START = b'*'
+FRAME_END = b'#'
+MAX_FRAME_LENGTH = 256
+
+
+class ResponseFramer:
+    """Cuts complete `*...#` frames out of a byte stream as it arrives.
+
+    Bytes outside of a frame (line breaks, prompts, line noise) are dropped. An unfinished
+    frame stays in the buffer until the rest of it is fed, also across commands.
+    Without a start marker a frame is everything up to the end marker, minus leading `ignore` bytes,
+    and a `prompt` the device sends when it is ready for the next command is a frame of its own.
+    """
+    __slots__ = ('_start', '_end', '_ignore', '_prompt', '_max_length', '_buffer')
+
+    def __init__(self,
+                 start: bytes = FRAME_START,
+                 end: bytes = FRAME_END,
+                 max_length: int = MAX_FRAME_LENGTH,
+                 ignore: bytes = b'',
+                 prompt: bytes = b'') -> None:
+        self._start = start
+        self._end = end
+        self._ignore = ignore
+        self._prompt = prompt
+        self._max_length = max_length
+        self._buffer = bytearray()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet returned as a frame."""
+        return len(self._buffer)
+
+    def is_prompt(self, frame: bytes) -> bool:
+        """Whether `frame` is the bare ready prompt rather than an answer."""
+        return bool(self._prompt) and frame == self._prompt
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def next_frame(self) -> Optional[bytes]:
+        """Return the next complete frame including its markers, or None if there is none yet."""
+        if not self._start:
+            return self._next_delimited_frame()
+        buffer = self._buffer
+        while True:
+            start = buffer.find(self._start)
+            if start < 0:
+                # nothing but noise, keep a possible partial start marker only
+                del buffer[:max(0, len(buffer) - len(self._start) + 1)]
+                return None
+            end = buffer.find(self._end, start + len(self._start))
+            if end < 0:
+                del buffer[:start]
+                if len(buffer) > self._max_length:
+                    # a start marker that never got closed, resync on the next one
+                    del buffer[:len(self._start)]
+                    continue
+                return None
+            stop = end + len(self._end)
+            next_start = buffer.find(self._start, start + len(self._start), end)
+            if next_start >= 0:
+                # a frame was cut off and another one started, drop the broken one
+                del buffer[:next_start]
+                continue
+            frame = bytes(buffer[start:stop])
+            del buffer[:stop]
+            return frame
+
+    def _next_delimited_frame(self) -> Optional[bytes]:
+        buffer = self._buffer
+        while True:
+            del buffer[:len(buffer) - len(buffer.lstrip(self._ignore))]
+            if self._prompt and buffer.startswith(self._prompt):
+                del buffer[:len(self._prompt)]
+                return self._prompt
+            end = buffer.find(self._end)
+            if end < 0:
+                if len(buffer) > self._max_length:
+                    del buffer[:]
+                return None
+            stop = end + len(self._end)
+            frame = bytes(buffer[:stop])
+            del buffer[:stop]
+            if len(frame) > len(self._end):
+                return frame
+
+    def clear(self) -> None:
+        self._buffer.clear()
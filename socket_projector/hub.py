@@ -1,13 +1,32 @@
+import asyncio
 import logging
+from dataclasses import dataclass, field
 from logging import Logger
+from types import MappingProxyType
+from typing import Callable, Dict, FrozenSet, List, Mapping, Optional
 
-import serial
-from typing import Optional, Union
+from serial import SerialException
 
-from serial import Serial
+from .breaker import CircuitBreaker
+from .cache import AttributeCache
+from .connection import ConnectionManager
+from .const import MAX_ATTRIBUTE_QUERIES_PER_POLL, POLL_BUDGET, POWER_DEBOUNCE
+from .deadline import Deadline
+from .messages import (AttributeQueryCommand, BaseSerialCommand, GetLampStateCommand, OffCommand, OnCommand,
+                       ProjectorStateCommandConfiguration, RawCommand, execute_pipelined)
+from .metrics import BREAKER_OPENS, POWER_REQUESTS_COLLAPSED, SHORT_CIRCUITS, ProjectorMetrics
+from .power import HOLD, SKIP, WAIT_POLL_MAX, WAIT_POLL_MIN, PowerStateMachine
+from .protocol import POWER_OFF, POWER_ON
+from .runtime import GatewayLimiter
+from .scheduler import PRIORITY_LISTEN, PRIORITY_POWER, PRIORITY_QUERY, CommandScheduler
+from .trace import WireTrace
+from .transport import create_transport
 
-from .messages import GetLampStateCommand, OnCommand, OffCommand
-from .messages import ProjectorStateCommandConfiguration
+# how long a single idle read waits for pushed frames before checking the line again
+LISTEN_WINDOW = 30
+LISTEN_RETRY_DELAY = 10
+# extra seconds a held power command waits beyond the expected end of a transition
+POWER_HOLD_SLACK = 30
 
 
 class ProjectorConfiguration:
@@ -15,17 +34,23 @@ class ProjectorConfiguration:
     __timeout: int
     __baudrate: int
     __statecommandconfig: ProjectorStateCommandConfiguration
+    __echo: Optional[bool]
+    __listen: bool
 
     def __init__(self,
                  socket_url: str,
                  timeout: int,
                  baudrate: int,
-                 statecommandconfig: ProjectorStateCommandConfiguration) -> None:
+                 statecommandconfig: ProjectorStateCommandConfiguration,
+                 echo: Optional[bool] = None,
+                 listen: bool = False) -> None:
         self.__socket_url = socket_url
         self.__timeout = timeout
         self.__write_timeout = timeout
         self.__baudrate = baudrate
         self.__statecommandconfig = statecommandconfig
+        self.__echo = echo
+        self.__listen = listen
 
     @property
     def socketurl(self) -> str:
@@ -47,74 +72,493 @@ class ProjectorConfiguration:
     def statecommandconfig(self):
         return self.__statecommandconfig
 
+    @property
+    def echo(self) -> Optional[bool]:
+        """Whether the device echoes commands, None to detect it on the first answer."""
+        return self.__echo
+
+    @property
+    def listen(self) -> bool:
+        """Whether the device pushes unsolicited state frames worth listening for."""
+        return self.__listen
+
+
+@dataclass(frozen=True)
+class ProjectorState:
+    """Immutable result of one poll cycle, shared by all entities of a projector."""
+    available: bool
+    is_on: Optional[bool]
+    attributes: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    # attributes that are missing from `attributes` or past their ttl after this cycle
+    stale_attributes: FrozenSet[str] = frozenset()
+    # one of the POWER_* states, telling warming up and cooling down apart from on and off
+    power_state: Optional[str] = None
+
 
 class Projector:
     projector_configuration: ProjectorConfiguration
     __id: str
     __logger: Logger
-    ser: Serial
+    _connection: ConnectionManager
+    _scheduler: CommandScheduler
+    _attributes: AttributeCache
+    _breaker: CircuitBreaker
+    _power: PowerStateMachine
+    _poll_task: Optional[asyncio.Future]
+    _listen_task: Optional[asyncio.Future]
+    _power_handler: Optional[Callable[[bool], None]]
+    _desired_power: Optional[bool]
+    _power_task: Optional[asyncio.Future]
+    _power_waiters: List[asyncio.Future]
+    # resolved by a new power request while a held one waits, so it is decided again
+    _power_retarget: Optional[asyncio.Future]
+    _power_deadline: Optional[Deadline]
+    _closing: bool
 
     def __init__(self,
                  projector_id: str,
-                 projector_configuration: ProjectorConfiguration) -> None:
+                 projector_configuration: ProjectorConfiguration,
+                 limiter: Optional[GatewayLimiter] = None) -> None:
         self.projector_configuration = projector_configuration
         self.__id = projector_id
         self.__logger = logging.getLogger(__name__)
 
-        self.ser = serial.serial_for_url(
+        self._connection = ConnectionManager(create_transport(
             url=projector_configuration.socketurl,
-            baudrate=projector_configuration.baudrate,
             timeout=projector_configuration.timeout,
             write_timeout=projector_configuration.write_timeout,
-            do_not_open=True)
+            baudrate=projector_configuration.baudrate,
+            framer=projector_configuration.statecommandconfig.profile.framer()), limiter=limiter)
+        self._connection.transport.echo = projector_configuration.echo
+        self._scheduler = CommandScheduler()
+        profile = projector_configuration.statecommandconfig.profile
+        self._attributes = AttributeCache({attribute: spec.ttl for attribute, spec in profile.attributes.items()},
+                                          MAX_ATTRIBUTE_QUERIES_PER_POLL)
+        self._breaker = CircuitBreaker()
+        self._power = PowerStateMachine(profile.warm_up, profile.cool_down, profile.reports_transitions)
+        self._poll_task = None
+        self._listen_task = None
+        self._power_handler = None
+        self._desired_power = None
+        self._power_task = None
+        self._power_waiters = []
+        self._power_retarget = None
+        self._power_deadline = None
+        self._closing = False
 
     @property
     def projector_id(self) -> str:
         return self.__id
 
-    async def test_connection(self) -> bool:
+    @property
+    def available(self) -> bool:
+        return self._connection.available and not self._breaker.is_open
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    @property
+    def echo(self) -> Optional[bool]:
+        """The echo mode in use, once configured or detected."""
+        return self._connection.transport.echo
+
+    @property
+    def power_state(self) -> Optional[str]:
+        """One of the POWER_* states, None until the device answered once."""
+        return self._power.state
+
+    @property
+    def metrics(self) -> ProjectorMetrics:
+        """Timings and counters of this projector's connection, commands and updates."""
+        return self._connection.transport.metrics
+
+    @property
+    def trace(self) -> WireTrace:
+        """The bytes that went over this projector's line lately."""
+        return self._connection.transport.trace
+
+    @property
+    def listening(self) -> bool:
+        return self._listen_task is not None and not self._listen_task.done()
+
+    def start_listening(self, power_handler: Callable[[bool], None]) -> None:
+        """Keep the line open and report pushed power state frames to `power_handler`.
+
+        Listening only uses the line while no command needs it and steps aside as soon as one does.
+        """
+        self._power_handler = power_handler
+        self._connection.transport.unsolicited_handler = self._on_unsolicited
+        if not self.listening:
+            self._listen_task = asyncio.ensure_future(self._listen())
+
+    async def _listen(self) -> None:
+        # a cancellation can get lost in a read that finishes at the same moment, close() also sets the flag
+        while not self._closing:
+            if self._breaker.is_open:
+                # leave reconnecting to the probes of the poll cycle
+                await asyncio.sleep(max(LISTEN_RETRY_DELAY, self._breaker.retry_in))
+                continue
+            if not self._connection.can_connect_now:
+                # listening never queues for a gateway permit, it would only push out the projectors
+                # that hold one and get pushed out in turn
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+                continue
+            try:
+                frame = await self._listen_once()
+            except SerialException as exc:
+                self.__logger.debug("Listening on %s failed: %s", self.projector_configuration.socketurl, exc)
+                async with self._scheduler.slot(PRIORITY_LISTEN):
+                    # the next round has to reconnect instead of reading from the broken line again
+                    await self._connection.close()
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+                continue
+            if frame is not None:
+                self._on_unsolicited(frame)
+
+    async def _listen_once(self) -> Optional[bytes]:
+        preempted = asyncio.Event()
+        async with self._scheduler.slot(PRIORITY_LISTEN, on_preempt=preempted.set):
+            if preempted.is_set() or self._closing:
+                return None
+            async with self._connection.session() as transport:
+                if self._closing:
+                    # close() came while connecting, its cancellation may not have made it through
+                    return None
+                # projectors waiting for a gateway permit preempt the listener just like local commands
+                self._connection.preempt_handler = preempted.set
+                read = asyncio.ensure_future(transport.read_frame(LISTEN_WINDOW))
+                stepped_aside = asyncio.ensure_future(preempted.wait())
+                try:
+                    await asyncio.wait({read, stepped_aside}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    self._connection.preempt_handler = None
+                    read.cancel()
+                    stepped_aside.cancel()
+                    # the read has to be gone before the slot is handed on
+                    await asyncio.wait({read, stepped_aside})
+                if read.cancelled():
+                    return None
+                try:
+                    return read.result()
+                except SerialException:
+                    # the line is in an unknown state, drop it before the session hands it on
+                    await transport.close()
+                    raise
+
+    def _on_unsolicited(self, frame: bytes) -> None:
+        command_table = self.projector_configuration.statecommandconfig.command_table
+        routed = command_table.dispatcher.dispatch(frame)
+        if routed is None:
+            self.__logger.debug("Ignoring unsolicited frame <%s>.", repr(frame))
+            return
+        name, value = routed
+        if name != command_table.power_state.name:
+            # a pushed attribute, published with the next poll
+            self._attributes.set(name, command_table.queries[name].values.get(value, value))
+            return
+        is_on = self._observe_power(value)
+        if is_on is not None and self._power_handler is not None:
+            self._power_handler(is_on)
+
+    async def _execute(self, cmd: BaseSerialCommand, priority: int, deadline: Optional[Deadline] = None) -> bool:
+        async with self._scheduler.slot(priority):
+            return await self._execute_now(cmd, deadline)
+
+    async def _execute_now(self, cmd: BaseSerialCommand, deadline: Optional[Deadline] = None) -> bool:
+        """Run `cmd` right away; the caller must hold a scheduler slot."""
+        cmd.logger = self.__logger
+        if deadline is not None and deadline.expired:
+            return False
+        if not self._allow():
+            return False
+        dispatcher = self.projector_configuration.statecommandconfig.command_table.dispatcher
         try:
-            self.__logger.debug("Opening connection...")
-            self.ser.open()
-            self.__logger.debug("Closing connection...")
-            self.ser.close()
-        except:
-            self.__logger.exception("Error on testing connection to %s", self.projector_configuration.socketurl)
+            async with self._connection.session() as transport:
+                ok = await cmd.execute(transport, deadline, dispatcher)
+        except SerialException as exc:
+            self._log_failure("Could not connect to %s: %s", self.projector_configuration.socketurl, exc)
+            self._record(False)
             return False
-        return True
+        # any answer, even an unexpected one, shows the device is there
+        self._record(ok or cmd.answer is not None)
+        return ok
 
-    async def get_state(self) -> Optional[bool]:
-        self.__logger.debug("Called get_state.")
-        cmd = GetLampStateCommand(self.projector_configuration.statecommandconfig)
-        cmd.logger = self.__logger
-        if not cmd.execute(self.ser):
-            self.__logger.error("Error while getting Lamp state.")
-        if cmd.answer == self.projector_configuration.statecommandconfig.pow_state_on_value:
+    async def query_many(self, commands: List[BaseSerialCommand], deadline: Optional[Deadline] = None) -> bool:
+        """Pipeline several queries over one connection; each command keeps its own answer."""
+        if not commands:
             return True
-        if cmd.answer == self.projector_configuration.statecommandconfig.pow_state_off_value:
+        for cmd in commands:
+            cmd.logger = self.__logger
+        try:
+            async with self._scheduler.slot(PRIORITY_QUERY):
+                timeout = self.projector_configuration.timeout
+                if deadline is not None:
+                    if deadline.expired:
+                        return False
+                    timeout = deadline.cap(timeout)
+                if not self._allow():
+                    return False
+                dispatcher = self.projector_configuration.statecommandconfig.command_table.dispatcher
+                async with self._connection.session() as transport:
+                    ok = await execute_pipelined(transport, commands, timeout, self.__logger, dispatcher)
+        except SerialException as exc:
+            self._log_failure("Could not connect to %s: %s", self.projector_configuration.socketurl, exc)
+            self._record(False)
             return False
-        return None
+        self._record(ok or any(cmd.answer is not None for cmd in commands))
+        return ok
+
+    def _allow(self) -> bool:
+        """Whether the circuit breaker lets a call through to the device right now."""
+        if self._breaker.allow():
+            return True
+        self.metrics.increment(SHORT_CIRCUITS)
+        return False
+
+    def _record(self, reachable: bool) -> None:
+        url = self.projector_configuration.socketurl
+        if reachable:
+            if self._breaker.record_success():
+                self.__logger.info("%s is reachable again.", url)
+        elif self._breaker.record_failure():
+            self.metrics.increment(BREAKER_OPENS)
+            self.__logger.warning("%s failed %s times in a row, pausing calls for %.0fs.",
+                                  url, self._breaker.failures, self._breaker.retry_in)
+
+    def _log_failure(self, message: str, *args) -> None:
+        """Log at error level until the breaker opens, the device is known to be gone after that."""
+        if self._breaker.is_open:
+            self.__logger.debug(message, *args)
+        else:
+            self.__logger.error(message, *args)
+
+    async def get_attributes(self, is_on: Optional[bool], deadline: Optional[Deadline] = None) -> Dict[str, str]:
+        """Refresh the due custom attributes and return all known values.
+
+        Only attributes the projector can answer in its current power state are queried;
+        values that need a running projector are dropped while it is off.
+        """
+        statecommandconfig = self.projector_configuration.statecommandconfig
+        queries = statecommandconfig.command_table.queries
+        answerable = []
+        for attribute in queries:
+            if queries[attribute].power_needed and not is_on:
+                self._attributes.invalidate(attribute)
+                continue
+            if queries[attribute].power_needed and self._power.in_transition:
+                # the lamp is still warming up, the last values stay until it can answer
+                continue
+            answerable.append(attribute)
+
+        commands = {attribute: AttributeQueryCommand(statecommandconfig, attribute)
+                    for attribute in self._attributes.due(answerable)}
+        await self.query_many(list(commands.values()), deadline)
+        for attribute, cmd in commands.items():
+            if cmd.answer is not None:
+                self._attributes.set(attribute, cmd.descriptor.values.get(cmd.answer, cmd.answer))
+        return self._attributes.values()
+
+    async def get_state(self, deadline: Optional[Deadline] = None) -> Optional[bool]:
+        """Query the power state; concurrent callers share one query."""
+        self.__logger.debug("Called get_state.")
+        statecommandconfig = self.projector_configuration.statecommandconfig
+        return await self._scheduler.run_once(statecommandconfig.pow_state_qry, PRIORITY_QUERY,
+                                              lambda: self._query_state(deadline))
+
+    async def _query_state(self, deadline: Optional[Deadline]) -> Optional[bool]:
+        cmd = GetLampStateCommand(self.projector_configuration.statecommandconfig)
+        if not await self._execute_now(cmd, deadline):
+            self._log_failure("Error while getting Lamp state.")
+        return self._observe_power(cmd.answer)
+
+    def _observe_power(self, answer: Optional[str]) -> Optional[bool]:
+        """Feed a power query answer to the state machine and return whether the projector is on."""
+        if answer is None:
+            return None
+        statecommandconfig = self.projector_configuration.statecommandconfig
+        if answer == statecommandconfig.pow_state_on_value:
+            state = POWER_ON
+        elif answer == statecommandconfig.pow_state_off_value:
+            state = POWER_OFF
+        else:
+            # other states the profile knows, e.g. a lamp that is still warming up
+            state = statecommandconfig.command_table.power_states.get(answer)
+            if state is None:
+                return None
+        self._power.observe(state)
+        return self._power.is_on
+
+    async def wait_for_state(self, state: str, timeout: float) -> bool:
+        """Wait until the projector reaches the POWER_* `state`, False if `timeout` passes first.
+
+        The power state is queried when a transition is expected to end and with growing pauses
+        otherwise; pushed state frames end the wait early.
+        """
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + timeout
+        pause = WAIT_POLL_MIN
+        while True:
+            if self._power.state == state:
+                return True
+            left = expires - loop.time()
+            if left <= 0:
+                return False
+            if self._power.transition_left > 0:
+                delay = max(WAIT_POLL_MIN, self._power.transition_left)
+            else:
+                delay = pause
+                pause = min(pause * 2, WAIT_POLL_MAX)
+            try:
+                await asyncio.wait_for(self._power.changed(), min(delay, left))
+                continue
+            except asyncio.TimeoutError:
+                pass
+            if self._power.state != state:
+                await self.get_state()
+
+    async def poll(self, budget: float = POLL_BUDGET) -> ProjectorState:
+        """Run one poll cycle against the device within `budget` seconds.
+
+        A call while a cycle is running shares that cycle's result instead of starting another one.
+        """
+        if self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.ensure_future(self._poll(Deadline(budget)))
+        return await asyncio.shield(self._poll_task)
+
+    async def _poll(self, deadline: Deadline) -> ProjectorState:
+        is_on = await self.get_state(deadline)
+        attributes = {}
+        if self.available:
+            attributes = await self.get_attributes(is_on, deadline)
+        queries = self.projector_configuration.statecommandconfig.command_table.queries
+        stale = frozenset(attribute for attribute in queries if self._attributes.is_stale(attribute))
+        if deadline.expired:
+            self.__logger.debug("Poll cycle ran out of time, stale attributes: %s", sorted(stale))
+        return ProjectorState(available=self.available, is_on=is_on,
+                              attributes=MappingProxyType(attributes), stale_attributes=stale,
+                              power_state=self._power.state)
 
     async def turn_on(self) -> bool:
-        """Turn the projector on."""
+        """Turn the projector on, after a running cool-down if there is one."""
         self.__logger.debug("Called turn_on.")
-        cmd = OnCommand(self.projector_configuration.statecommandconfig)
-        cmd.logger = self.__logger
-        if not cmd.execute(self.ser):
-            self.__logger.error("Error while turning beamer on.")
-            return False
-        return True
+        await self._hold_power(True)
+        return await self._send_power(True)
 
     async def turn_off(self) -> bool:
-        """Turn the projector off."""
+        """Turn the projector off, after a running warm-up if there is one."""
         self.__logger.debug("Called turn_off.")
-        cmd = OffCommand(self.projector_configuration.statecommandconfig)
-        cmd.logger = self.__logger
-        if not cmd.execute(self.ser):
-            self.__logger.error("Error while turning beamer off.")
+        await self._hold_power(False)
+        return await self._send_power(False)
+
+    async def _send_power(self, on: bool, deadline: Optional[Deadline] = None) -> bool:
+        """Send the power command unless the projector is already heading that way or `deadline` passed."""
+        if self._power.decide(on) == SKIP:
+            self.__logger.debug("Projector is already %s, not sending a power command again.", self._power.state)
+            return True
+        statecommandconfig = self.projector_configuration.statecommandconfig
+        cmd = OnCommand(statecommandconfig) if on else OffCommand(statecommandconfig)
+        if not await self._execute(cmd, PRIORITY_POWER, deadline):
+            self._log_failure("Error while turning beamer %s.", 'on' if on else 'off')
             return False
+        self._power.commanded(on)
         return True
 
+    async def send_command(self, command: str, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Send `command` through the command template and return the reply, None if there was none."""
+        cmd = RawCommand(self.projector_configuration.statecommandconfig, command)
+        async with self._scheduler.slot(PRIORITY_POWER):
+            if not await self._execute_now(cmd, deadline):
+                self._log_failure("Error while sending %s.", command)
+                return None
+        return cmd.answer
+
+    async def _hold_power(self,
+                          on: bool,
+                          interrupt: Optional[asyncio.Future] = None,
+                          deadline: Optional[Deadline] = None) -> None:
+        """Wait out a transition the device would reject the power command in, or until `interrupt` resolves."""
+        if self._power.decide(on) != HOLD:
+            return
+        settled = POWER_OFF if on else POWER_ON
+        self.__logger.debug("Holding the power command until the projector is %s.", settled)
+        timeout = self._power.transition_left + POWER_HOLD_SLACK
+        if deadline is not None:
+            timeout = deadline.cap(timeout)
+        hold = asyncio.ensure_future(self.wait_for_state(settled, timeout))
+        try:
+            await asyncio.wait({hold} if interrupt is None else {hold, interrupt}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            hold.cancel()
+
+    @property
+    def pending_power(self) -> Optional[bool]:
+        """The power state requested but not confirmed yet, None while no request is in flight."""
+        return self._desired_power
+
+    def request_power(self, on: bool, deadline: Optional[Deadline] = None) -> asyncio.Future:
+        """Ask for a power state without waiting for it.
+
+        Requests that come in within POWER_DEBOUNCE, or while an earlier one is still being sent,
+        collapse into the last of them, so a burst of toggles sends one command. The returned
+        future resolves to the power state queried once the command went out, None if unknown.
+        The last request's `deadline` applies: once it passed, no power command goes out for it.
+        """
+        if self._desired_power is not None:
+            self.metrics.increment(POWER_REQUESTS_COLLAPSED)
+        self._desired_power = on
+        self._power_deadline = deadline
+        if self._power_retarget is not None and not self._power_retarget.done():
+            # a held command has to be decided again for the new target
+            self._power_retarget.set_result(None)
+        waiter = asyncio.get_running_loop().create_future()
+        self._power_waiters.append(waiter)
+        if self._power_task is None or self._power_task.done():
+            self._power_task = asyncio.ensure_future(self._apply_power())
+        return waiter
+
+    async def _apply_power(self) -> None:
+        confirmed = None
+        try:
+            await asyncio.sleep(POWER_DEBOUNCE)
+            while True:
+                target, deadline = self._desired_power, self._power_deadline
+                self._power_retarget = asyncio.get_running_loop().create_future()
+                await self._hold_power(target, self._power_retarget, deadline)
+                if self._desired_power != target:
+                    # asked for something else while holding, only the latest request may go out
+                    continue
+                if deadline is not None and deadline.expired:
+                    self.__logger.debug("Power request ran out of time, not sending it.")
+                    break
+                await self._send_power(target, deadline)
+                if self._desired_power != target:
+                    continue
+                confirmed = await self.get_state(deadline)
+                if self._desired_power == target:
+                    break
+        finally:
+            waiters, self._power_waiters = self._power_waiters, []
+            self._desired_power = None
+            self._power_deadline = None
+            self._power_retarget = None
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(confirmed)
+
     async def close(self) -> None:
-        if self.ser is not None and self.ser.is_open:
-            self.ser.close()
+        self._closing = True
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.wait({self._poll_task})
+            self._poll_task = None
+        if self._power_task is not None:
+            self._power_task.cancel()
+            await asyncio.wait({self._power_task})
+            self._power_task = None
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.wait({self._listen_task})
+            self._listen_task = None
+        async with self._scheduler.slot(PRIORITY_POWER):
+            await self._connection.close()
@@ -1,11 +1,26 @@
+import asyncio
+import functools
 import sys
 import re
 
-from serial import Serial, SerialException
+from serial import SerialException
 from logging import Logger
-from typing import Optional, List, AnyStr, Union
+from types import MappingProxyType
+from typing import Optional, List, AnyStr, Mapping, Pattern, Sequence, Tuple, Union
 from abc import ABC
 
+from .deadline import Deadline
+from .framing import ResponseFramer
+from .metrics import ERRORS, FIRST_BYTE, TIMEOUTS, WRITE
+from .protocol import POWER_OFF, POWER_ON, ProtocolProfile
+from .transport import ProjectorTransport
+
+# name the latency of a pipelined batch is recorded under
+BATCH_COMMAND = 'batch'
+# name raw commands are recorded under, and the template that takes any reply as their answer
+RAW_COMMAND = 'raw'
+RAW_ANSWER = '(.*)'
+
 
 class ProjectorCommandConfiguration(ABC):
     command_template: str
@@ -24,6 +39,8 @@ class ProjectorStateCommandConfiguration(ProjectorCommandConfiguration):
     pow_state_qry: str
     pow_state_on_value: str
     pow_state_off_value: str
+    profile: ProtocolProfile
+    _command_table: Optional['CommandTable']
 
     def __init__(self,
                  command_template: str,
@@ -32,21 +49,178 @@ class ProjectorStateCommandConfiguration(ProjectorCommandConfiguration):
                  pow_off_command: str,
                  pow_state_query: str,
                  pow_state_on_value: str,
-                 pow_state_off_value: str):
+                 pow_state_off_value: str,
+                 profile: ProtocolProfile):
         super().__init__(command_template, response_template)
         self.pow_on_command = pow_on_command
         self.pow_off_command = pow_off_command
         self.pow_state_qry = pow_state_query
         self.pow_state_on_value = pow_state_on_value
         self.pow_state_off_value = pow_state_off_value
+        self.profile = profile
+        self._command_table = None
+
+    @classmethod
+    def from_profile(cls, profile: ProtocolProfile) -> 'ProjectorStateCommandConfiguration':
+        """The configuration a profile declares, without any user overrides."""
+        return cls(command_template=profile.command_template,
+                   response_template=profile.power_answer,
+                   pow_on_command=profile.power_on,
+                   pow_off_command=profile.power_off,
+                   pow_state_query=profile.power_query,
+                   pow_state_on_value=profile.power_value(POWER_ON),
+                   pow_state_off_value=profile.power_value(POWER_OFF),
+                   profile=profile)
+
+    @property
+    def command_table(self) -> 'CommandTable':
+        """The precompiled commands for this configuration, shared by all equal configurations."""
+        if self._command_table is None:
+            self._command_table = _command_table(self.profile, self.command_template, self.response_template,
+                                                 self.pow_on_command, self.pow_off_command, self.pow_state_qry)
+        return self._command_table
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_template(response_template: str) -> Pattern[bytes]:
+    return re.compile(response_template.encode('ascii'))
+
+
+def _echo_of(frame: bytes, framer: ResponseFramer) -> Optional[bytes]:
+    framer.feed(frame)
+    echo = framer.next_frame()
+    framer.clear()
+    return echo
+
+
+class CommandDescriptor:
+    """A command formatted, encoded and compiled once; instances are immutable and shared."""
+    __slots__ = ('name', 'command', 'text', 'frame', 'echo', 'answer_template', 'power_needed', 'values')
+    name: str
+    command: str
+    text: str
+    frame: bytes
+    echo: Optional[bytes]
+    answer_template: Pattern[bytes]
+    power_needed: bool
+    values: Mapping[str, str]
+
+    def __init__(self,
+                 name: str,
+                 command: str,
+                 command_template: str,
+                 response_template: str,
+                 power_needed: bool,
+                 framer: ResponseFramer,
+                 values: Mapping[str, str] = MappingProxyType({})):
+        text = command_template.format(command)
+        frame = text.encode('ascii')
+        init = super().__setattr__
+        init('name', name)
+        init('command', command)
+        init('text', text)
+        init('frame', frame)
+        init('echo', _echo_of(frame, framer))
+        init('answer_template', _compile_template(response_template))
+        init('power_needed', power_needed)
+        init('values', values)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __repr__(self) -> str:
+        return "{}({!r}, {!r})".format(type(self).__name__, self.name, self.text)
+
+
+class ResponseDispatcher:
+    """Routes a frame to the descriptor whose answer template it fits, with one regex match.
+
+    All templates are joined into a single alternation, each wrapped in a named group, so the
+    group that took part in the match names the descriptor and the group after it holds the value.
+    Templates that cannot be combined, e.g. because they reuse a group name, are tried one by one.
+    """
+    __slots__ = ('_combined', '_routes', '_fallback')
+    _combined: Optional[Pattern[bytes]]
+    _routes: Mapping[str, Tuple[str, int]]
+    _fallback: Sequence[CommandDescriptor]
+
+    def __init__(self, descriptors: Sequence[CommandDescriptor]):
+        alternatives = [b'(?P<_%d>%s)' % (index, descriptor.answer_template.pattern)
+                        for index, descriptor in enumerate(descriptors)]
+        try:
+            combined = re.compile(b'|'.join(alternatives))
+        except re.error:
+            combined = None
+        self._combined = combined
+        self._routes = {} if combined is None else {
+            '_{}'.format(index): (descriptor.name, combined.groupindex['_{}'.format(index)] + 1)
+            for index, descriptor in enumerate(descriptors)
+        }
+        self._fallback = tuple(descriptors)
+
+    def dispatch(self, frame: bytes) -> Optional[Tuple[str, str]]:
+        """Return the descriptor name and the raw captured value for `frame`, None if nothing fits."""
+        if self._combined is None:
+            for descriptor in self._fallback:
+                match = descriptor.answer_template.match(frame)
+                if match:
+                    return descriptor.name, match.group(1).decode('ascii', errors='replace')
+            return None
+        match = self._combined.match(frame)
+        if match is None:
+            return None
+        name, group = self._routes[match.lastgroup]
+        return name, match.group(group).decode('ascii', errors='replace')
+
+
+class CommandTable:
+    """Every command of one ProjectorStateCommandConfiguration, ready to send."""
+    __slots__ = ('power_on', 'power_off', 'power_state', 'power_states', 'queries', 'dispatcher')
+    power_on: CommandDescriptor
+    power_off: CommandDescriptor
+    power_state: CommandDescriptor
+    # raw power query answer -> power state as declared by the profile
+    power_states: Mapping[str, str]
+    queries: Mapping[str, CommandDescriptor]
+    dispatcher: ResponseDispatcher
+
+    def __init__(self,
+                 profile: ProtocolProfile,
+                 template: str,
+                 response_template: str,
+                 pow_on_command: str,
+                 pow_off_command: str,
+                 pow_state_query: str):
+        framer = profile.framer()
+        # the set commands are acknowledged in the profile's own words, not answered like the query
+        self.power_on = CommandDescriptor('power_on', pow_on_command, template, profile.power_ack, False, framer)
+        self.power_off = CommandDescriptor('power_off', pow_off_command, template, profile.power_ack, True, framer)
+        self.power_state = CommandDescriptor('power_state', pow_state_query, template, response_template, False,
+                                             framer)
+        self.power_states = profile.power_states
+        self.queries = MappingProxyType({
+            attribute: CommandDescriptor(attribute, spec.query, template, spec.answer, spec.power_needed, framer,
+                                         spec.values)
+            for attribute, spec in profile.attributes.items()
+        })
+        self.dispatcher = ResponseDispatcher([self.power_state, *self.queries.values()])
+
+
+@functools.lru_cache(maxsize=None)
+def _command_table(profile: ProtocolProfile,
+                   template: str,
+                   response_template: str,
+                   pow_on_command: str,
+                   pow_off_command: str,
+                   pow_state_query: str) -> CommandTable:
+    return CommandTable(profile, template, response_template, pow_on_command, pow_off_command, pow_state_query)
 
 
 class BaseSerialCommand(ABC):
-    _command_configuration: ProjectorCommandConfiguration
-    _command: str
+    __slots__ = ('_descriptor', '_logger', '_answer')
+    _descriptor: CommandDescriptor
     _logger: Optional[Logger]
     _answer: Optional[str]
-    _power_needed: bool
 
     class PrintLogger:
         def __print__(self, message: str, *args):
@@ -66,86 +240,221 @@ class BaseSerialCommand(ABC):
         def warn(self, message: str, *args):
             self.__print__("WARN: " + message, args)
 
-    def __init__(self,
-                 command: str,
-                 command_configuration: ProjectorCommandConfiguration):
-        self._command_configuration = command_configuration
-        self._command = command
+    def __init__(self, descriptor: CommandDescriptor):
+        self._descriptor = descriptor
         self._logger = None
         self._answer = None
-        self._power_needed = True
-        self._answer_template = re.compile(command_configuration.response_template)
 
     @property
     def logger(self) -> Union[Logger, PrintLogger]:
-        return self._logger or BaseSerialCommand.PrintLogger()
+        return self._logger or _PRINT_LOGGER
 
     @logger.setter
     def logger(self, value: Logger):
         self._logger = value
 
+    @property
+    def descriptor(self) -> CommandDescriptor:
+        return self._descriptor
+
     @property
     def answer(self) -> str:
         return self._answer
 
     @property
     def power_needed(self) -> bool:
-        return self._power_needed
+        return self._descriptor.power_needed
 
     def get_command(self) -> str:
-        return self._command_configuration.command_template.format(self._command)
+        return self._descriptor.text
+
+    def is_echo(self, frame: bytes) -> bool:
+        return frame == self._descriptor.echo
+
+    def take_answer(self, value: str) -> None:
+        self._answer = value
 
-    def execute(self, ser: Serial) -> bool:
+    def try_answer(self, frame: bytes) -> bool:
+        """Take `frame` as this command's answer if it fits the response template."""
+        match = self._descriptor.answer_template.match(frame)
+        if not match:
+            return False
+        self._answer = match.group(1).decode('ascii', errors='replace')
+        return True
+
+    async def execute(self,
+                      transport: ProjectorTransport,
+                      deadline: Optional[Deadline] = None,
+                      dispatcher: Optional[ResponseDispatcher] = None) -> bool:
+        """Send the command and wait for its answer.
+
+        Once the echo mode of the line is known, the first frame that should be the answer
+        decides right away; an unexpected reply fails the command instead of waiting out
+        the timeout. While it is unknown, the mode is learned from the first answered command.
+        Frames `dispatcher` knows as answers to other queries were pushed by the device; they
+        go to the transport's unsolicited handler. The wait never runs past `deadline`.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            return await self._execute(transport, deadline, dispatcher)
+        finally:
+            transport.metrics.observe_command(self._descriptor.name, loop.time() - started)
+
+    async def _execute(self,
+                       transport: ProjectorTransport,
+                       deadline: Optional[Deadline],
+                       dispatcher: Optional[ResponseDispatcher]) -> bool:
+        loop = asyncio.get_running_loop()
+        metrics = transport.metrics
+        timeout = transport.timeout if deadline is None else deadline.cap(transport.timeout)
         try:
-            if not ser.is_open:
-                self.logger.debug("connecting to serial.")
-                ser.open()
-            self.logger.debug('sending <%s>.', repr(self.get_command()))
-            ser.write(self.get_command().encode('ascii'))
-            self.logger.debug('reading first answer.')
-            answer_to_skip = ser.read_until()
-            self.logger.debug('first answer line: <%s>.', repr(answer_to_skip))
-            self.logger.debug('reading second answer.')
-            raw_answer = ser.read_until().decode('ascii')
-            self.logger.debug('second answer line: <%s>.', repr(raw_answer))
-            ser.close()
-            self.logger.debug('parsing answer.')
-
-            match = self._answer_template.match(raw_answer)
-            if match:
-                self.logger.debug("match found!")
-                self._answer = match.group(1)
-                self.logger.debug("match saved: %s", self._answer)
-                return True
-            else:
-                self._answer = raw_answer
-                return False
+            transport.discard_pending()
+            with metrics.timed(WRITE):
+                await transport.write(self._descriptor.frame)
+            written = loop.time()
+            expires = written + timeout
+            echo_seen = False
+            first_frame = True
+            while True:
+                frame = await transport.read_frame(expires - loop.time())
+                if frame is None:
+                    transport.trace.event('no answer to {}'.format(self._descriptor.name))
+                    metrics.increment(TIMEOUTS)
+                    return False
+                if first_frame:
+                    metrics.observe(FIRST_BYTE, loop.time() - written)
+                    first_frame = False
+                if self.is_echo(frame):
+                    echo_seen = True
+                    continue
+                if self.try_answer(frame):
+                    if transport.echo is None:
+                        transport.echo = echo_seen
+                    return True
+                if transport.is_prompt(frame):
+                    # the device is ready again, the answer itself may still be on its way
+                    continue
+                if dispatcher is not None and transport.unsolicited_handler is not None \
+                        and dispatcher.dispatch(frame) is not None:
+                    # pushed by the device, the answer is still to come
+                    transport.unsolicited_handler(frame)
+                    continue
+                self._answer = frame.decode('ascii', errors='replace')
+                if transport.echo is False or echo_seen:
+                    # this frame was the answer slot and it is not what we asked for
+                    transport.trace.event('unexpected answer to {}'.format(self._descriptor.name))
+                    return False
+                # a late answer to an earlier command, keep waiting
         except SerialException as serialException:
             self.logger.error("exception happened when communicating:\n%s", serialException)
+            transport.trace.event(str(serialException))
+            metrics.increment(ERRORS)
+            # the line is in an unknown state, drop it so the next command reconnects
+            await transport.close()
             return False
-        except:
+        except Exception:
             self.logger.error("unexpected error: %s", sys.exc_info())
+            metrics.increment(ERRORS)
             return False
-        finally:
-            if ser.is_open:
-                ser.close()
+
+
+_PRINT_LOGGER = BaseSerialCommand.PrintLogger()
+
+
+async def execute_pipelined(transport: ProjectorTransport,
+                            commands: List[BaseSerialCommand],
+                            timeout: float,
+                            logger: Logger,
+                            dispatcher: ResponseDispatcher) -> bool:
+    """Send all queries back to back, then let `dispatcher` hand each reply frame to its query.
+
+    Returns True once every command got its answer, False if `timeout` ran out first.
+    """
+    loop = asyncio.get_running_loop()
+    metrics = transport.metrics
+    started = loop.time()
+    pending = {cmd.descriptor.name: cmd for cmd in commands}
+    # with a known echo mode there is no need to wait for frames that will never come
+    expected_frames = None if transport.echo is None else len(commands) * (2 if transport.echo else 1)
+    try:
+        transport.discard_pending()
+        with metrics.timed(WRITE):
+            await transport.write(b''.join(cmd.descriptor.frame for cmd in commands))
+        written = loop.time()
+        expires = written + timeout
+        first_frame = True
+        while pending and expected_frames != 0:
+            frame = await transport.read_frame(expires - loop.time())
+            if frame is None:
+                break
+            if first_frame:
+                metrics.observe(FIRST_BYTE, loop.time() - written)
+                first_frame = False
+            if transport.is_prompt(frame):
+                continue
+            routed = dispatcher.dispatch(frame)
+            if routed is not None and routed[0] in pending:
+                pending.pop(routed[0]).take_answer(routed[1])
+            elif routed is not None and transport.unsolicited_handler is not None:
+                # pushed by the device, the answers the batch waits for are still to come
+                transport.unsolicited_handler(frame)
+                continue
+            if expected_frames is not None:
+                expected_frames -= 1
+    except SerialException as serialException:
+        logger.error("exception happened when communicating:\n%s", serialException)
+        transport.trace.event(str(serialException))
+        metrics.increment(ERRORS)
+        await transport.close()
+        return False
+    finally:
+        metrics.observe_command(BATCH_COMMAND, loop.time() - started)
+    if pending:
+        transport.trace.event('no answer to {}'.format(', '.join(pending)))
+        metrics.increment(TIMEOUTS)
+    return not pending
+
+
+class AttributeQueryCommand(BaseSerialCommand):
+    __slots__ = ()
+
+    def __init__(self, conf: ProjectorStateCommandConfiguration, attribute: str):
+        super().__init__(conf.command_table.queries[attribute])
 
 
 class OnCommand(BaseSerialCommand):
+    __slots__ = ()
+
     def __init__(self, conf: ProjectorStateCommandConfiguration):
-        super().__init__(conf.pow_on_command, conf)
-        self._power_needed = False
+        super().__init__(conf.command_table.power_on)
 
 
 class OffCommand(BaseSerialCommand):
+    __slots__ = ()
+
     def __init__(self, conf: ProjectorStateCommandConfiguration):
-        super().__init__(conf.pow_off_command, conf)
+        super().__init__(conf.command_table.power_off)
 
 
 class GetLampStateCommand(BaseSerialCommand):
+    __slots__ = ()
+
     def __init__(self, conf: ProjectorStateCommandConfiguration):
-        super().__init__(conf.pow_state_qry, conf)
-        self._power_needed = False
+        super().__init__(conf.command_table.power_state)
+
+
+@functools.lru_cache(maxsize=128)
+def _raw_descriptor(profile: ProtocolProfile, template: str, command: str) -> CommandDescriptor:
+    return CommandDescriptor(RAW_COMMAND, command, template, RAW_ANSWER, False, profile.framer())
+
+
+class RawCommand(BaseSerialCommand):
+    """Any command put through the command template; the first reply that is not its echo is the answer."""
+    __slots__ = ()
+
+    def __init__(self, conf: ProjectorStateCommandConfiguration, command: str):
+        super().__init__(_raw_descriptor(conf.profile, conf.command_template, command))
 
 #
 # class GetLampHoursCommand(BaseSerialCommand):
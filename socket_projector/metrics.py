@@ -0,0 +1,131 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Sequence, Tuple
+
+# histogram bucket upper bounds in seconds, everything slower lands in the overflow bucket
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# timings
+CONNECT = 'connect'
+WRITE = 'write'
+FIRST_BYTE = 'first_byte'
+COMMAND = 'command'
+UPDATE = 'update'
+SERVICE_CALL = 'service_call'
+
+# counters
+CONNECTS = 'connects'
+RECONNECTS = 'reconnects'
+CONNECT_FAILURES = 'connect_failures'
+TIMEOUTS = 'timeouts'
+ERRORS = 'errors'
+BREAKER_OPENS = 'breaker_opens'
+SHORT_CIRCUITS = 'short_circuits'
+POWER_REQUESTS_COLLAPSED = 'power_requests_collapsed'
+
+
+class Histogram:
+    """Counts observations into fixed latency buckets; memory stays constant however many come in."""
+    __slots__ = ('_bounds', '_counts', 'count', 'total', 'max', 'last')
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self._bounds = tuple(bounds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def observe(self, seconds: float) -> None:
+        self._counts[bisect.bisect_left(self._bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, the maximum for the overflow bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        buckets = {'le_{}'.format(bound): count for bound, count in zip(self._bounds, self._counts)}
+        buckets['le_inf'] = self._counts[-1]
+        return {
+            'count': self.count,
+            'mean': round(self.mean, 4),
+            'p50': round(self.quantile(0.5), 4),
+            'p95': round(self.quantile(0.95), 4),
+            'max': round(self.max, 4),
+            'last': round(self.last, 4),
+            'buckets': buckets,
+        }
+
+
+class ProjectorMetrics:
+    """Latency histograms and event counters of one projector connection.
+
+    Command latencies are kept per command name next to the overall `command` timing,
+    so a slow query stands out from the rest.
+    """
+    _clock: Callable[[], float]
+    _timings: Dict[str, Histogram]
+    _commands: Dict[str, Histogram]
+    _counters: Dict[str, int]
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._timings = {}
+        self._commands = {}
+        self._counters = {}
+
+    def timing(self, name: str) -> Histogram:
+        histogram = self._timings.get(name)
+        if histogram is None:
+            histogram = self._timings[name] = Histogram()
+        return histogram
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def observe(self, name: str, seconds: float) -> None:
+        self.timing(name).observe(seconds)
+
+    def observe_command(self, command: str, seconds: float) -> None:
+        self.observe(COMMAND, seconds)
+        histogram = self._commands.get(command)
+        if histogram is None:
+            histogram = self._commands[command] = Histogram()
+        histogram.observe(seconds)
+
+    def increment(self, name: str) -> None:
+        self._counters[name] = self._counters.get(name, 0) + 1
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """Record the wall time of the block, also when it raises."""
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self._clock() - started)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'counters': dict(self._counters),
+            'timings': {name: histogram.as_dict() for name, histogram in self._timings.items()},
+            'commands': {name: histogram.as_dict() for name, histogram in self._commands.items()},
+        }
@@ -0,0 +1,124 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+from .protocol import POWER_COOLING, POWER_OFF, POWER_ON, POWER_WARMING
+
+# what to do with a power command in the current state
+SEND = 'send'
+SKIP = 'skip'
+HOLD = 'hold'
+
+# bounds of the pause between power queries while waiting for a state
+WAIT_POLL_MIN = 1.0
+WAIT_POLL_MAX = 10.0
+
+
+class PowerStateMachine:
+    """Power state of one projector, including the minutes spent warming up and cooling down.
+
+    Devices that report warming and cooling are taken by their word. For devices that only
+    know on and off, a power command starts a transition that lasts the profile's warm-up
+    or cool-down time; answers in between that already say the target state do not end it.
+    """
+    _warm_up: float
+    _cool_down: float
+    _reports_transitions: bool
+    _state: Optional[str]
+    _until: float
+    _waiters: List[asyncio.Future]
+
+    def __init__(self,
+                 warm_up: float,
+                 cool_down: float,
+                 reports_transitions: bool,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._warm_up = warm_up
+        self._cool_down = cool_down
+        self._reports_transitions = reports_transitions
+        self._clock = clock
+        self._state = None
+        self._until = 0.0
+        self._waiters = []
+
+    @property
+    def state(self) -> Optional[str]:
+        """One of the POWER_* states, None until the device answered once."""
+        if self._state in (POWER_WARMING, POWER_COOLING) and not self._reports_transitions \
+                and self._clock() >= self._until:
+            self._state = POWER_ON if self._state == POWER_WARMING else POWER_OFF
+        return self._state
+
+    @property
+    def is_on(self) -> Optional[bool]:
+        state = self.state
+        if state is None:
+            return None
+        return state in (POWER_ON, POWER_WARMING)
+
+    @property
+    def in_transition(self) -> bool:
+        return self.state in (POWER_WARMING, POWER_COOLING)
+
+    @property
+    def transition_left(self) -> float:
+        """Seconds the running transition is expected to take, 0 outside of one or once overdue."""
+        if not self.in_transition:
+            return 0.0
+        return max(0.0, self._until - self._clock())
+
+    def decide(self, on: bool) -> str:
+        """Whether a power command has to go out, is already under way, or has to wait.
+
+        A settled state may be stale, e.g. after the remote was used, so it never skips a command.
+        """
+        state = self.state
+        if on:
+            if state == POWER_WARMING:
+                return SKIP
+            return HOLD if state == POWER_COOLING else SEND
+        if state == POWER_COOLING:
+            return SKIP
+        return HOLD if state == POWER_WARMING else SEND
+
+    def commanded(self, on: bool) -> None:
+        """Note a power command the device accepted."""
+        if on and self.state != POWER_ON:
+            self._enter(POWER_WARMING, self._warm_up)
+        elif not on and self.state != POWER_OFF:
+            self._enter(POWER_COOLING, self._cool_down)
+
+    def observe(self, state: Optional[str]) -> None:
+        """Note a power state the device answered or pushed."""
+        if state is None:
+            return
+        current = self.state
+        if state in (POWER_WARMING, POWER_COOLING):
+            if current != state:
+                self._enter(state, self._warm_up if state == POWER_WARMING else self._cool_down)
+            return
+        if not self._reports_transitions and (current, state) in ((POWER_WARMING, POWER_ON),
+                                                                  (POWER_COOLING, POWER_OFF)):
+            # the device says where it is heading, not that it got there
+            return
+        if current != state:
+            self._state = state
+            self._until = 0.0
+            self._notify()
+
+    def changed(self) -> asyncio.Future:
+        """A future that resolves with the next observed or commanded state change."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        return waiter
+
+    def _enter(self, state: str, duration: float) -> None:
+        self._state = state
+        self._until = self._clock() + duration
+        self._notify()
+
+    def _notify(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(self._state)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from .messages import ProjectorStateCommandConfiguration
+from .protocol import ProtocolProfile
+from .transport import SOCKET_SCHEMES, create_transport
+
+_LOGGER = logging.getLogger(__name__)
+
+# the first round waits this long per candidate, every further round twice as long
+PROBE_START_TIMEOUT = 0.25
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """What the first candidate that answered told about the device."""
+    profile: str
+    baudrate: int
+    echo: bool
+    model: str
+    seconds: float
+
+
+def candidates(url: str,
+               profiles: Sequence[ProtocolProfile],
+               baudrates: Sequence[int]) -> List[Tuple[ProtocolProfile, int]]:
+    """Every profile and baud rate pair worth trying, in the order given.
+
+    The baud rate of a network gateway is set on the gateway, so socket urls only try the first one.
+    """
+    if urlparse(url).scheme in SOCKET_SCHEMES:
+        baudrates = baudrates[:1]
+    return [(profile, baudrate) for baudrate in baudrates for profile in profiles]
+
+
+async def _probe_once(url: str,
+                      profile: ProtocolProfile,
+                      baudrate: int,
+                      timeout: float) -> Tuple[Optional[Tuple[str, bool]], bool]:
+    """Ask for the identifying attribute once.
+
+    Returns the answer and echo mode, or None, and whether any frame came back at all.
+    """
+    command_table = ProjectorStateCommandConfiguration.from_profile(profile).command_table
+    identify = command_table.queries[profile.identify]
+    transport = create_transport(url, timeout=timeout, write_timeout=timeout, baudrate=baudrate,
+                                 framer=profile.framer())
+    heard = False
+    try:
+        await transport.open()
+        await transport.write(identify.frame)
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + timeout
+        echo = False
+        while True:
+            frame = await transport.read_frame(expires - loop.time())
+            if frame is None:
+                return None, heard
+            heard = True
+            if frame == identify.echo:
+                echo = True
+                continue
+            routed = command_table.dispatcher.dispatch(frame)
+            if routed is not None and routed[0] == identify.name:
+                return (routed[1], echo), heard
+    finally:
+        if transport.is_open:
+            await transport.close()
+
+
+async def async_probe(url: str,
+                      profiles: Sequence[ProtocolProfile],
+                      baudrates: Sequence[int],
+                      max_timeout: float) -> Optional[ProbeResult]:
+    """Try the candidates in order and stop at the first valid reply.
+
+    Each round gives every candidate a short timeout and doubles it for the next round,
+    up to `max_timeout`, so a quick device is found quickly and a slow one still answers.
+    A candidate that got replies without the one asked for had the line right but the protocol
+    wrong; it is not retried. Raises SerialException if the url cannot be opened at all.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    pending = candidates(url, profiles, baudrates)
+    timeout = min(PROBE_START_TIMEOUT, max_timeout)
+    while pending:
+        silent = []
+        for profile, baudrate in pending:
+            _LOGGER.debug("Probing %s with %s at %s baud, waiting %ss.", url, profile.name, baudrate, timeout)
+            answer, heard = await _probe_once(url, profile, baudrate, timeout)
+            if answer is not None:
+                model, echo = answer
+                return ProbeResult(profile=profile.name, baudrate=baudrate, echo=echo, model=model,
+                                   seconds=loop.time() - started)
+            if not heard:
+                silent.append((profile, baudrate))
+        if timeout >= max_timeout:
+            return None
+        pending = silent
+        timeout = min(timeout * 2, max_timeout)
+    return None
@@ -0,0 +1,119 @@
+import functools
+import json
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+from .const import ATTRIBUTE_TTLS
+from .framing import ResponseFramer
+
+PROTOCOLS_DIR = Path(__file__).parent / 'protocols'
+
+# power state a raw power query answer stands for
+POWER_ON = 'on'
+POWER_OFF = 'off'
+POWER_WARMING = 'warming'
+POWER_COOLING = 'cooling'
+
+# seconds a lamp typically needs, profiles may declare their own in `power`
+DEFAULT_WARM_UP = 60.0
+DEFAULT_COOL_DOWN = 90.0
+
+
+class AttributeSpec:
+    """How to query one attribute and read its answer."""
+    __slots__ = ('name', 'query', 'answer', 'power_needed', 'ttl', 'values')
+    name: str
+    query: str
+    answer: str
+    power_needed: bool
+    ttl: Optional[float]
+    # raw answer -> value shown to the user, raw answers missing here are shown as they are
+    values: Mapping[str, str]
+
+    def __init__(self, name: str, spec: Mapping[str, Any]) -> None:
+        self.name = name
+        self.query = spec['query']
+        self.answer = spec['answer']
+        self.power_needed = spec.get('power_needed', False)
+        self.ttl = spec['ttl'] if 'ttl' in spec else ATTRIBUTE_TTLS.get(name)
+        self.values = MappingProxyType(dict(spec.get('values', {})))
+
+
+class ProtocolProfile:
+    """One vendor protocol as declared in protocols/<name>.json.
+
+    A profile names the frame markers, the command template, the power commands with the
+    raw states their query answers, and the attributes the device can be asked for.
+    """
+    __slots__ = ('name', 'title', 'frame_start', 'frame_end', 'frame_ignore', 'frame_prompt', 'command_template',
+                 'power_on', 'power_off', 'power_query', 'power_answer', 'power_ack', 'power_states', 'warm_up',
+                 'cool_down',
+                 'identify', 'attributes')
+    name: str
+    title: str
+    frame_start: bytes
+    frame_end: bytes
+    frame_ignore: bytes
+    frame_prompt: bytes
+    command_template: str
+    power_on: str
+    power_off: str
+    power_query: str
+    power_answer: str
+    # what the device answers to the power on and off commands
+    power_ack: str
+    power_states: Mapping[str, str]
+    warm_up: float
+    cool_down: float
+    # attribute whose value tells devices apart, used for the unique id
+    identify: str
+    attributes: Mapping[str, AttributeSpec]
+
+    def __init__(self, name: str, spec: Mapping[str, Any]) -> None:
+        framing = spec['framing']
+        power = spec['power']
+        self.name = name
+        self.title = spec['title']
+        self.frame_start = framing.get('start', '').encode('ascii')
+        self.frame_end = framing['end'].encode('ascii')
+        self.frame_ignore = framing.get('ignore', '').encode('ascii')
+        self.frame_prompt = framing.get('prompt', '').encode('ascii')
+        self.command_template = spec['command_template']
+        self.power_on = power['on']
+        self.power_off = power['off']
+        self.power_query = power['query']
+        self.power_answer = power['answer']
+        # devices that answer a power command like a power query need no ack of their own
+        self.power_ack = power.get('ack', power['answer'])
+        self.power_states = MappingProxyType(dict(power['states']))
+        self.warm_up = power.get('warm_up', DEFAULT_WARM_UP)
+        self.cool_down = power.get('cool_down', DEFAULT_COOL_DOWN)
+        self.identify = spec['identify']
+        self.attributes = MappingProxyType({
+            attribute: AttributeSpec(attribute, attribute_spec)
+            for attribute, attribute_spec in spec['attributes'].items()
+        })
+
+    def power_value(self, state: str) -> str:
+        """The first raw answer that stands for `state`."""
+        return next(raw for raw, mapped in self.power_states.items() if mapped == state)
+
+    @property
+    def reports_transitions(self) -> bool:
+        """Whether the power query answers tell warming up and cooling down apart from on and off."""
+        return bool({POWER_WARMING, POWER_COOLING} & set(self.power_states.values()))
+
+    def framer(self) -> ResponseFramer:
+        return ResponseFramer(self.frame_start, self.frame_end, ignore=self.frame_ignore, prompt=self.frame_prompt)
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(type(self).__name__, self.name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_profile(name: str) -> ProtocolProfile:
+    """Read and parse a profile on first use; this touches the disk, keep it off the event loop."""
+    path = PROTOCOLS_DIR / '{}.json'.format(name)
+    with path.open(encoding='utf-8') as file:
+        return ProtocolProfile(name, json.load(file))
@@ -0,0 +1,99 @@
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Dict, Set, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_GATEWAY_LIMIT = 4
+
+
+class GatewayLimiter:
+    """Bounds the connections open at once to one gateway, first come first served.
+
+    A freed permit goes straight to the longest waiting projector, so a busy projector cannot
+    grab it back ahead of the others. While anybody waits, holders that sit idle on their
+    connection are asked to give it up through the callback they acquired with.
+    """
+    _host: str
+    _limit: int
+    _holders: Dict[object, Callable[[], None]]
+    _waiters: Deque[Tuple[object, Callable[[], None], asyncio.Future]]
+
+    def __init__(self, host: str, limit: int = DEFAULT_GATEWAY_LIMIT) -> None:
+        self._host = host
+        self._limit = limit
+        self._holders = {}
+        self._waiters = deque()
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def in_use(self) -> int:
+        return len(self._holders)
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    def free_for(self, owner: object) -> bool:
+        """Whether `owner` holds a permit or would get one without waiting."""
+        return owner in self._holders or (len(self._holders) < self._limit and not self.waiting)
+
+    async def acquire(self, owner: object, on_pressure: Callable[[], None]) -> None:
+        """Wait for a permit; `on_pressure` is called whenever others wait while `owner` holds it."""
+        if owner in self._holders:
+            return
+        if len(self._holders) < self._limit and not self.waiting:
+            self._holders[owner] = on_pressure
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((owner, on_pressure, waiter))
+        for pressure in list(self._holders.values()):
+            pressure()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # _hand_over() booked the permit for us before the cancellation hit, the next waiter gets it
+                self.release(owner)
+            raise
+
+    def release(self, owner: object) -> None:
+        if self._holders.pop(owner, None) is not None:
+            self._hand_over()
+
+    def _hand_over(self) -> None:
+        while self._waiters:
+            owner, on_pressure, waiter = self._waiters.popleft()
+            if not waiter.done():
+                # booked right away, so nobody can slip in before the waiter wakes up
+                self._holders[owner] = on_pressure
+                waiter.set_result(None)
+                return
+
+
+class ProjectorRuntime:
+    """I/O state shared by all config entries: one GatewayLimiter per gateway host."""
+    _gateway_limit: int
+    _limiters: Dict[str, GatewayLimiter]
+
+    def __init__(self, gateway_limit: int = DEFAULT_GATEWAY_LIMIT) -> None:
+        self._gateway_limit = gateway_limit
+        self._limiters = {}
+
+    @property
+    def gateways(self) -> Set[str]:
+        return set(self._limiters)
+
+    @staticmethod
+    def gateway_of(url: str) -> str:
+        """The host of a network url, the url itself for a local port."""
+        return urlparse(url).hostname or url
+
+    def limiter_for(self, url: str) -> GatewayLimiter:
+        gateway = self.gateway_of(url)
+        limiter = self._limiters.get(gateway)
+        if limiter is None:
+            limiter = self._limiters[gateway] = GatewayLimiter(gateway, self._gateway_limit)
+        return limiter
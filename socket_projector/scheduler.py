@@ -0,0 +1,90 @@
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+PRIORITY_POWER = 0
+PRIORITY_QUERY = 10
+PRIORITY_LISTEN = 100
+
+
+class CommandScheduler:
+    """Serializes access to one projector, lowest priority value first.
+
+    Waiters with equal priority are served in arrival order. A command already talking to the
+    device is never interrupted, but power commands jump ahead of every queued status query.
+    """
+    _busy: bool
+    _waiters: List[list]
+    _in_flight: Dict[Hashable, asyncio.Future]
+    _on_preempt: Optional[Callable[[], None]]
+
+    def __init__(self) -> None:
+        self._busy = False
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._in_flight = {}
+        self._on_preempt = None
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    @asynccontextmanager
+    async def slot(self, priority: int, on_preempt: Optional[Callable[[], None]] = None) -> AsyncIterator[None]:
+        """Hold the exclusive right to talk to the device.
+
+        A holder that passes `on_preempt` gets it called as soon as anybody else asks for a slot,
+        and is expected to give the slot back quickly.
+        """
+        await self._acquire(priority)
+        self._on_preempt = on_preempt
+        if on_preempt is not None and self.queued:
+            self._preempt()
+        try:
+            yield
+        finally:
+            self._on_preempt = None
+            self._release()
+
+    async def run_once(self, key: Hashable, priority: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `factory()` in a slot, letting concurrent callers with the same key share its result."""
+        shared = self._in_flight.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(self._run(priority, factory))
+            self._in_flight[key] = shared
+            shared.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(shared)
+
+    async def _run(self, priority: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.slot(priority):
+            return await factory()
+
+    async def _acquire(self, priority: int) -> None:
+        if not self._busy:
+            self._busy = True
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), waiter])
+        self._preempt()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # _release() woke us as the next holder, nobody else would ever free the slot
+                self._release()
+            raise
+
+    def _preempt(self) -> None:
+        on_preempt, self._on_preempt = self._on_preempt, None
+        if on_preempt is not None:
+            on_preempt()
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._busy = False
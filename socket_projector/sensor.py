@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .coordinator import ProjectorCoordinator
+from .const import DOMAIN
+from .metrics import COMMAND, RECONNECTS, TIMEOUTS, UPDATE, ProjectorMetrics
+
+# key -> (name, unit, state class, reads the value off the metrics)
+METRIC_SENSORS: dict[str, tuple[str, Optional[str], SensorStateClass, Callable[[ProjectorMetrics], float]]] = {
+    'command_latency': ('Command latency', UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+                        lambda metrics: round(metrics.timing(COMMAND).mean * 1000, 1)),
+    'command_latency_p95': ('Command latency p95', UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+                            lambda metrics: round(metrics.timing(COMMAND).quantile(0.95) * 1000, 1)),
+    'update_duration': ('Update duration', UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+                        lambda metrics: round(metrics.timing(UPDATE).last * 1000, 1)),
+    'timeouts': ('Timeouts', None, SensorStateClass.TOTAL_INCREASING,
+                 lambda metrics: metrics.counter(TIMEOUTS)),
+    'reconnects': ('Reconnects', None, SensorStateClass.TOTAL_INCREASING,
+                   lambda metrics: metrics.counter(RECONNECTS)),
+}
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    config_entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback
+) -> None:
+    """Add the metric sensors of one projector, disabled until the user enables them."""
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    async_add_entities([ProjectorMetricSensor(coordinator, key) for key in METRIC_SENSORS])
+
+
+class ProjectorMetricSensor(CoordinatorEntity, SensorEntity):
+    """One value of the projector metrics, refreshed with every coordinator update."""
+    coordinator: ProjectorCoordinator
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator: ProjectorCoordinator, key: str) -> None:
+        super().__init__(coordinator)
+        self._projector = coordinator.projector
+        self._key = key
+        name, unit, state_class, self._read = METRIC_SENSORS[key]
+        self._attr_name = '{} {}'.format(self._projector.projector_id, name)
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+
+    @property
+    def native_value(self) -> float:
+        return self._read(self._projector.metrics)
+
+    @property
+    def unique_id(self) -> str:
+        """Return Unique ID string."""
+        return '{}_{}'.format(self._projector.projector_id, self._key)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import voluptuous as vol
+
+from homeassistant.const import ATTR_ENTITY_ID
+from homeassistant.core import HomeAssistant, ServiceCall, ServiceResponse, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, entity_registry as er
+
+from .const import DOMAIN
+from .coordinator import ProjectorCoordinator
+from .deadline import Deadline
+
+_LOGGER = logging.getLogger(__name__)
+
+SERVICE_SEND_COMMAND = 'send_command'
+ATTR_POWER = 'power'
+ATTR_COMMAND = 'command'
+ATTR_TIMEOUT = 'timeout'
+
+SEND_COMMAND_SCHEMA = vol.All(
+    vol.Schema({
+        vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+        vol.Exclusive(ATTR_POWER, 'command'): cv.boolean,
+        vol.Exclusive(ATTR_COMMAND, 'command'): cv.string,
+        vol.Optional(ATTR_TIMEOUT, default=30): vol.All(vol.Coerce(float), vol.Range(min=1, max=600)),
+    }),
+    cv.has_at_least_one_key(ATTR_POWER, ATTR_COMMAND),
+)
+
+
+def async_setup_services(hass: HomeAssistant) -> None:
+    """Register the services that act on several projectors at once."""
+
+    async def send_command(call: ServiceCall) -> ServiceResponse:
+        coordinators = _coordinators_for(hass, call.data.get(ATTR_ENTITY_ID))
+        results = await async_send_to_all(coordinators, call.data.get(ATTR_POWER), call.data.get(ATTR_COMMAND),
+                                          call.data[ATTR_TIMEOUT])
+        return {'results': results}
+
+    hass.services.async_register(DOMAIN, SERVICE_SEND_COMMAND, send_command, schema=SEND_COMMAND_SCHEMA,
+                                 supports_response=SupportsResponse.OPTIONAL)
+
+
+def _coordinators_for(hass: HomeAssistant, entity_ids: Optional[List[str]]) -> List[ProjectorCoordinator]:
+    """The coordinators behind `entity_ids`, every loaded projector if none are given."""
+    loaded = {entry_id: coordinator for entry_id, coordinator in hass.data.get(DOMAIN, {}).items()
+              if isinstance(coordinator, ProjectorCoordinator)}
+    if entity_ids is None:
+        return list(loaded.values())
+    registry = er.async_get(hass)
+    chosen = {}
+    for entity_id in entity_ids:
+        entry = registry.async_get(entity_id)
+        if entry is None or entry.config_entry_id not in loaded:
+            raise HomeAssistantError('{} is not a loaded {} entity'.format(entity_id, DOMAIN))
+        chosen[entry.config_entry_id] = loaded[entry.config_entry_id]
+    return list(chosen.values())
+
+
+async def async_send_to_all(coordinators: List[ProjectorCoordinator],
+                            power: Optional[bool],
+                            command: Optional[str],
+                            timeout: float) -> Dict[str, Dict[str, Any]]:
+    """Send the power change or raw command to every projector at once, all within `timeout` seconds.
+
+    Projectors behind one gateway still take turns within its connection limit. Projectors that
+    have not finished when the time is up are cancelled and reported as timed out.
+    """
+    deadline = Deadline(timeout)
+    tasks = {asyncio.ensure_future(_send_one(coordinator, power, command, deadline)): coordinator
+             for coordinator in coordinators}
+    if not tasks:
+        return {}
+    started = time.monotonic()
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+
+    results = {}
+    for task, coordinator in tasks.items():
+        projector_id = coordinator.projector.projector_id
+        if task in pending:
+            results[projector_id] = {'success': False, 'error': 'timeout',
+                                     'seconds': round(time.monotonic() - started, 3)}
+        elif task.exception() is not None:
+            _LOGGER.error("Sending to %s failed: %s", projector_id, task.exception())
+            results[projector_id] = {'success': False, 'error': str(task.exception())}
+        else:
+            results[projector_id] = task.result()
+    return results
+
+
+async def _send_one(coordinator: ProjectorCoordinator,
+                    power: Optional[bool],
+                    command: Optional[str],
+                    deadline: Deadline) -> Dict[str, Any]:
+    projector = coordinator.projector
+    started = time.monotonic()
+    if power is not None:
+        # the debounced path the switch takes; nothing goes out once the deadline passed
+        confirmed = await coordinator.async_request_power(power, deadline)
+        result = {'success': confirmed == power, 'is_on': confirmed}
+    else:
+        answer = await projector.send_command(command, deadline)
+        result = {'success': answer is not None, 'answer': answer}
+    if not result['success']:
+        result['error'] = 'unavailable' if not projector.available else 'no_answer'
+    result['seconds'] = round(time.monotonic() - started, 3)
+    return result
@@ -1,20 +1,26 @@
 from __future__ import annotations
-from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
-from typing import Any
+from typing import Any, Mapping, Optional
+
+import voluptuous as vol
 
 from homeassistant.components.switch import SwitchEntity
 from homeassistant.config_entries import ConfigEntry
 
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv, entity_platform
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .hub import Projector
+from .coordinator import ProjectorCoordinator
 from .const import DOMAIN
-from homeassistant.const import STATE_UNKNOWN
+from .protocol import POWER_COOLING, POWER_OFF, POWER_ON, POWER_WARMING
 
-_executor = ThreadPoolExecutor(10)
+SERVICE_WAIT_FOR_POWER_STATE = 'wait_for_power_state'
+ATTR_POWER_STATE = 'power_state'
+ATTR_TIMEOUT = 'timeout'
 
 
 # This function is called as part of the __init__.async_setup_entry (via the
@@ -25,46 +31,67 @@ async def async_setup_entry(
     async_add_entities: AddEntitiesCallback
 ) -> None:
     """Add cover for passed config_entry in HA."""
-    # The hub is loaded from the associated hass.data entry that was created in the
+    # The coordinator is loaded from the associated hass.data entry that was created in the
     # __init__.async_setup_entry function
-    projector = hass.data[DOMAIN][config_entry.entry_id]
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
 
     # The next few lines find all of the entities that will need to be added
     # to HA. Note these are all added to a list, so async_add_devices can be
     # called just once.
     new_devices = []
-    projector_entity = ConfiguredProjector(projector)
+    projector_entity = ConfiguredProjector(coordinator)
     new_devices.append(projector_entity)
 
     # If we have any new devices, add them
     if new_devices:
         async_add_entities(new_devices)
 
+    platform = entity_platform.async_get_current_platform()
+    platform.async_register_entity_service(
+        SERVICE_WAIT_FOR_POWER_STATE,
+        {
+            vol.Required(ATTR_POWER_STATE): vol.In([POWER_ON, POWER_OFF, POWER_WARMING, POWER_COOLING]),
+            vol.Optional(ATTR_TIMEOUT, default=180): vol.All(cv.positive_float, vol.Range(max=600)),
+        },
+        'async_wait_for_power_state',
+    )
+
 
-class ConfiguredProjector(SwitchEntity):
-    def __init__(self, projector: Projector) -> None:
-        self._projector = projector
-        self._attr_is_on = False
+class ConfiguredProjector(CoordinatorEntity, SwitchEntity):
+    coordinator: ProjectorCoordinator
 
-    async def async_will_remove_from_hass(self) -> None:
-        """Entity being removed from hass."""
-        # The opposite of async_added_to_hass. Remove any registered call backs here.
-        await self._projector.close()
+    def __init__(self, coordinator: ProjectorCoordinator) -> None:
+        super().__init__(coordinator)
+        self._projector = coordinator.projector
+
+    @property
+    def available(self) -> bool:
+        return super().available and self.coordinator.data is not None and self.coordinator.data.available
 
-    async def async_update(self):
-        self._attr_available = await self._projector.test_connection()
-        if not self._attr_available:
-            self._attr_state = STATE_UNKNOWN
-        self._attr_is_on = await self._projector.get_state()
-        # TODO load further custom attributes
+    @property
+    def is_on(self) -> Optional[bool]:
+        if self.coordinator.data is None:
+            return None
+        return self.coordinator.data.is_on
+
+    @property
+    def extra_state_attributes(self) -> Optional[Mapping[str, Any]]:
+        if self.coordinator.data is None:
+            return None
+        return {**self.coordinator.data.attributes, ATTR_POWER_STATE: self.coordinator.data.power_state}
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        if await self._projector.turn_on():
-            self._attr_is_on = True
+        self.coordinator.async_request_power(True)
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        if await self._projector.turn_off():
-            self._attr_is_on = False
+        self.coordinator.async_request_power(False)
+
+    async def async_wait_for_power_state(self, power_state: str, timeout: float) -> None:
+        """Let scripts wait for a warm-up or cool-down to finish instead of sleeping a fixed time."""
+        if not await self._projector.wait_for_state(power_state, timeout):
+            raise HomeAssistantError('{} did not reach power state {} within {}s'.format(
+                self._projector.projector_id, power_state, timeout))
+        self.coordinator.async_set_power(self._projector.power_state in (POWER_ON, POWER_WARMING))
 
     @property
     def unique_id(self) -> str:
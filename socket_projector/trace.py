@@ -0,0 +1,85 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_CAPACITY = 256
+# longer records keep their head, a runaway read must not pin a large buffer
+MAX_RECORD_BYTES = 256
+
+# record kinds
+TX = 'tx'
+RX = 'rx'
+EVENT = 'event'
+
+
+class WireTrace:
+    """The last `capacity` bytes written, bytes read and line events of one projector.
+
+    Slots are allocated up front and overwritten in a ring; recording stores a timestamp
+    and a reference to the bytes object, nothing is formatted until someone dumps the trace.
+    """
+    __slots__ = ('_capacity', '_clock', '_times', '_kinds', '_data', '_next', '_recorded')
+    _capacity: int
+    _times: List[float]
+    _kinds: List[Optional[str]]
+    _data: List[Any]
+    _next: int
+    _recorded: int
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, clock: Callable[[], float] = time.monotonic) -> None:
+        self._capacity = capacity
+        self._clock = clock
+        self._times = [0.0] * capacity
+        self._kinds = [None] * capacity
+        self._data = [None] * capacity
+        self._next = 0
+        self._recorded = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def recorded(self) -> int:
+        """Records ever made, including the ones already overwritten."""
+        return self._recorded
+
+    def record(self, kind: str, data: Any) -> None:
+        if not self._capacity:
+            return
+        if len(data) > MAX_RECORD_BYTES:
+            data = data[:MAX_RECORD_BYTES]
+        slot = self._next
+        self._times[slot] = self._clock()
+        self._kinds[slot] = kind
+        self._data[slot] = data
+        self._next = (slot + 1) % self._capacity
+        self._recorded += 1
+
+    def tx(self, data: bytes) -> None:
+        self.record(TX, data)
+
+    def rx(self, data: bytes) -> None:
+        self.record(RX, data)
+
+    def event(self, message: str) -> None:
+        self.record(EVENT, message)
+
+    def clear(self) -> None:
+        self._kinds = [None] * self._capacity
+        self._data = [None] * self._capacity
+        self._next = 0
+        self._recorded = 0
+
+    def dump(self) -> List[Dict[str, Any]]:
+        """The kept records, oldest first, with times in seconds relative to the newest one."""
+        kept = min(self._recorded, self._capacity)
+        if not kept:
+            return []
+        first = (self._next - kept) % self._capacity
+        slots = [(first + index) % self._capacity for index in range(kept)]
+        newest = self._times[slots[-1]]
+        return [{
+            't': round(self._times[slot] - newest, 4),
+            'kind': self._kinds[slot],
+            'data': self._data[slot] if self._kinds[slot] == EVENT else repr(self._data[slot])[2:-1],
+        } for slot in slots]
@@ -0,0 +1,337 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import serial
+from serial import Serial, SerialException
+
+from .framing import ResponseFramer
+from .metrics import ProjectorMetrics
+from .trace import WireTrace
+
+SOCKET_SCHEMES = ['socket']
+
+READ_CHUNK_SIZE = 4096
+# how long a serial reader thread blocks before it checks whether it should stop
+READER_POLL_INTERVAL = 0.2
+
+
+class ProjectorTransport(ABC):
+    """Async byte stream to a projector that hands out complete response frames."""
+    _url: str
+    _timeout: float
+    _write_timeout: float
+    _framer: ResponseFramer
+    echo: Optional[bool]
+    unsolicited_handler: Optional[Callable[[bytes], None]]
+    metrics: ProjectorMetrics
+    trace: WireTrace
+
+    def __init__(self, url: str, timeout: float, write_timeout: float,
+                 framer: Optional[ResponseFramer] = None) -> None:
+        self._url = url
+        self._timeout = timeout
+        self._write_timeout = write_timeout
+        self._framer = framer or ResponseFramer()
+        # whether the device echoes every command, None until known
+        self.echo = None
+        # receives complete frames that arrived while no command was waiting for them
+        self.unsolicited_handler = None
+        # timings and counters of everything that goes over this line
+        self.metrics = ProjectorMetrics()
+        # raw bytes that went over this line lately, for diagnostics
+        self.trace = WireTrace()
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    @property
+    @abstractmethod
+    def is_open(self) -> bool:
+        ...
+
+    @abstractmethod
+    async def open(self) -> None:
+        ...
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    async def _read_chunk(self, timeout: float) -> bytes:
+        """Return whatever arrives within `timeout`, b'' if nothing did."""
+
+    @abstractmethod
+    async def close(self) -> None:
+        ...
+
+    def is_prompt(self, frame: bytes) -> bool:
+        return self._framer.is_prompt(frame)
+
+    def discard_pending(self) -> None:
+        """Clear the buffer before a new command, e.g. from a late answer to one that already gave up.
+
+        Complete frames are handed to the unsolicited handler first, so pushed state changes are not lost.
+        """
+        if self.unsolicited_handler is not None:
+            frame = self._framer.next_frame()
+            while frame is not None:
+                if not self._framer.is_prompt(frame):
+                    self.unsolicited_handler(frame)
+                frame = self._framer.next_frame()
+        self._framer.clear()
+
+    async def read_frame(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Return the next complete frame as soon as it is in, None if `timeout` passes first.
+
+        Bytes following the frame stay buffered for the next call.
+        """
+        frame = self._framer.next_frame()
+        if frame is not None:
+            return frame
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self._timeout if timeout is None else timeout)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            chunk = await self._read_chunk(remaining)
+            if chunk:
+                self.trace.rx(chunk)
+                self._framer.feed(chunk)
+                frame = self._framer.next_frame()
+                if frame is not None:
+                    return frame
+
+
+class SocketTransport(ProjectorTransport):
+    """Asyncio stream transport for socket://host:port urls."""
+    _reader: Optional[asyncio.StreamReader]
+    _writer: Optional[asyncio.StreamWriter]
+
+    def __init__(self, url: str, timeout: float, write_timeout: float,
+                 framer: Optional[ResponseFramer] = None) -> None:
+        super().__init__(url, timeout, write_timeout, framer)
+        parsed = urlparse(url)
+        if parsed.hostname is None or parsed.port is None:
+            raise SerialException("expected url in the form socket://host:port, got {!r}".format(url))
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._reader = None
+        self._writer = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def open(self) -> None:
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self._host, self._port), self._timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise SerialException("could not open port {}: {!r}".format(self._url, exc)) from exc
+        self._framer.clear()
+
+    async def write(self, data: bytes) -> None:
+        if not self.is_open:
+            raise SerialException("port {} is not open".format(self._url))
+        self.trace.tx(data)
+        try:
+            self._writer.write(data)
+            await asyncio.wait_for(self._writer.drain(), self._write_timeout)
+        except asyncio.TimeoutError as exc:
+            raise SerialException("write timeout on {}".format(self._url)) from exc
+        except OSError as exc:
+            raise SerialException("write failed on {}: {!r}".format(self._url, exc)) from exc
+
+    async def _read_chunk(self, timeout: float) -> bytes:
+        if not self.is_open:
+            raise SerialException("port {} is not open".format(self._url))
+        read = asyncio.ensure_future(self._reader.read(READ_CHUNK_SIZE))
+        try:
+            # asyncio.wait_for can drop a cancellation that meets a finished read, wait() never does
+            await asyncio.wait({read}, timeout=timeout)
+        except asyncio.CancelledError:
+            if read.done() and not read.cancelled() and read.exception() is None and read.result():
+                # the bytes are already off the socket, keep them for whoever reads next
+                self.trace.rx(read.result())
+                self._framer.feed(read.result())
+            read.cancel()
+            raise
+        if not read.done():
+            read.cancel()
+            return b''
+        try:
+            chunk = read.result()
+        except OSError as exc:
+            raise SerialException("read failed on {}: {!r}".format(self._url, exc)) from exc
+        if not chunk:
+            raise SerialException("connection to {} closed by peer".format(self._url))
+        return chunk
+
+    async def close(self) -> None:
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        self._framer.clear()
+        if writer is None:
+            return
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+class SerialTransport(ProjectorTransport):
+    """Runs a blocking pyserial port, local or rfc2217://, on threads of its own.
+
+    While the port is open a reader thread keeps reading and hands every chunk to the event loop,
+    so no bytes are lost between commands. Open, write and close run on a single worker thread
+    of the port. Serial I/O never waits in the executor Home Assistant shares with everything else.
+    """
+    _serial: Optional[Serial]
+    _worker: Optional[ThreadPoolExecutor]
+    _reader: Optional[threading.Thread]
+    # set when the current reader thread should stop; also tells its late callbacks apart
+    _stop_reading: Optional[threading.Event]
+    _received: bytearray
+    _data_ready: Optional[asyncio.Event]
+    _reader_error: Optional[BaseException]
+
+    def __init__(self, url: str, timeout: float, write_timeout: float, baudrate: int,
+                 framer: Optional[ResponseFramer] = None) -> None:
+        super().__init__(url, timeout, write_timeout, framer)
+        self._baudrate = baudrate
+        self._serial = None
+        self._worker = None
+        self._reader = None
+        self._stop_reading = None
+        self._received = bytearray()
+        self._data_ready = None
+        self._reader_error = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._serial is not None and self._serial.is_open and self._stop_reading is not None
+
+    async def _run(self, func, *args):
+        if self._worker is None:
+            self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='projector_io')
+        return await asyncio.get_running_loop().run_in_executor(self._worker, func, *args)
+
+    def _open(self) -> None:
+        if self._serial is None:
+            self._serial = serial.serial_for_url(
+                url=self._url,
+                baudrate=self._baudrate,
+                timeout=READER_POLL_INTERVAL,
+                write_timeout=self._write_timeout,
+                do_not_open=True)
+        self._serial.open()
+
+    async def open(self) -> None:
+        await self._run(self._open)
+        self._framer.clear()
+        self._received.clear()
+        self._reader_error = None
+        self._data_ready = asyncio.Event()
+        stop = self._stop_reading = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop,
+                                        args=(asyncio.get_running_loop(), self._serial, stop),
+                                        name='projector_reader', daemon=True)
+        self._reader.start()
+
+    def _read_loop(self, loop: asyncio.AbstractEventLoop, port: Serial, stop: threading.Event) -> None:
+        """Reader thread: read until the port is closed and hand the bytes to the event loop."""
+        try:
+            while not stop.is_set():
+                chunk = port.read(1)
+                if chunk and port.in_waiting:
+                    chunk += port.read(port.in_waiting)
+                if chunk:
+                    loop.call_soon_threadsafe(self._on_received, stop, chunk)
+        except Exception as exc:
+            # closing the port from the worker thread ends a blocking read with an error
+            if not stop.is_set():
+                try:
+                    loop.call_soon_threadsafe(self._on_reader_failed, stop, exc)
+                except RuntimeError:
+                    # the loop is gone, so is everyone who could have cared
+                    pass
+
+    def _on_received(self, stop: threading.Event, chunk: bytes) -> None:
+        if stop is self._stop_reading:
+            self._received += chunk
+            self._data_ready.set()
+
+    def _on_reader_failed(self, stop: threading.Event, exc: BaseException) -> None:
+        if stop is self._stop_reading:
+            self._reader_error = exc
+            self._data_ready.set()
+
+    async def write(self, data: bytes) -> None:
+        if not self.is_open:
+            raise SerialException("port {} is not open".format(self._url))
+        self.trace.tx(data)
+        await self._run(self._serial.write, data)
+
+    async def _read_chunk(self, timeout: float) -> bytes:
+        if not self.is_open:
+            raise SerialException("port {} is not open".format(self._url))
+        if not self._received and self._reader_error is None:
+            self._data_ready.clear()
+            ready = asyncio.ensure_future(self._data_ready.wait())
+            try:
+                # unlike asyncio.wait_for, wait() never drops a cancellation that meets the data
+                await asyncio.wait({ready}, timeout=timeout)
+            finally:
+                ready.cancel()
+            if not self._received and self._reader_error is None:
+                return b''
+        if self._reader_error is not None:
+            raise SerialException("read failed on {}: {!r}".format(self._url, self._reader_error))
+        chunk = bytes(self._received)
+        self._received.clear()
+        return chunk
+
+    async def close(self) -> None:
+        self._framer.clear()
+        self._received.clear()
+        stop, self._stop_reading = self._stop_reading, None
+        reader, self._reader = self._reader, None
+        worker, self._worker = self._worker, None
+        if stop is not None:
+            stop.set()
+        if worker is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            if self._serial is not None and self._serial.is_open:
+                await loop.run_in_executor(worker, self._serial.close)
+            if reader is not None:
+                # the reader notices the stop within one poll interval at the latest
+                await loop.run_in_executor(worker, reader.join, READER_POLL_INTERVAL * 2)
+        finally:
+            worker.shutdown(wait=False)
+
+
+def create_transport(url: str, timeout: float, write_timeout: float, baudrate: int,
+                     framer: Optional[ResponseFramer] = None) -> ProjectorTransport:
+    """Pick the transport for the given pyserial style url; `framer` defaults to BenQ style frames.
+
+    socket:// urls get the asyncio stream backend, everything else pyserial understands,
+    local ports and rfc2217:// included, a serial port with threads of its own.
+    """
+    if urlparse(url).scheme in SOCKET_SCHEMES:
+        return SocketTransport(url, timeout, write_timeout, framer)
+    return SerialTransport(url, timeout, write_timeout, baudrate, framer)